@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the lookup and aggregation functions, and check of their results against benchmark_reference.npz
+
+Every function is timed for one query, over the full grid (Z = 4-30 and all the stages/ shells/ transitions it
+takes) and for batches of random queries (fixed seed) of each size of --sizes, with the array version of the
+function when there is one (Z_st_s_rows for Z_st_s_row, electrons_batch, query.answer, yield_cube) and a loop otherwise. The
+import time and the time to load the tables (with and without the binary copies of __tablecache__) are measured in
+new processes. The memoization of emitted_electrons is turned off for these timings (they measure the lookups); the
+memoized functions are also timed for one query answered from their cache (single (cached)).
+
+The results over the grid and for a batch of 1000 queries are compared with the reference file, and the script
+fails (exit code 1) if one of them has changed, so that a faster version cannot silently change the physics.
+
+Usage:
+python benchmarks.py                   # timings and check
+python benchmarks.py --sizes 1,100     # smaller batches
+python benchmarks.py --json bench.json # timings also written as JSON
+python benchmarks.py --update          # writes the reference file with the current results (after a wanted change)
+
+Recap of all functions:
+
+queries(name, size, seed): random valid arguments of a function
+cases(): single query, grid and batch versions of every function
+startup_times(): import and table loading times, in new processes
+run(sizes, repeat): timings (list of dicts) and results
+check(results, reference, rtol, atol): names of the results that are different from the reference
+main(argv): the command-line tool
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import emitted_electrons as ee
+import avg_photon as ap
+import query
+
+reference_file = os.path.join(ee.data_dir, "benchmark_reference.npz")
+seed = 12345
+check_size = 1000  # size of the batch compared with the reference
+il_groups = [1, 2, (1, 2), (3, 4), 5, (13, 14), 16, (20, 21), 22]
+
+
+def queries(name, size, seed = seed):
+    rng = np.random.default_rng(seed)
+    Z = rng.integers(5, 31, size)
+    st = rng.integers(1, Z + 1)
+    s = rng.integers(1, 8, size)
+    if name in ("Z_st_s_idx", "Z_st_s_row", "electrons", "avg_photon"):
+        return([Z, st, s])
+    if name in ("all_electrons", "energy_Z"):
+        return([s])
+    if name == "fluo_yield":
+        return([Z, rng.integers(0, len(il_groups), size)])
+    if name == "all_fluo_yield":
+        return([rng.integers(1, 28, size), rng.integers(0, len(il_groups), size)])
+    return([Z, s])  # energy, energy_st
+
+
+def _grid(name):   # every argument of the function over Z = 4-30
+    Z = range(4, 31)
+    if name in ("Z_st_s_idx", "Z_st_s_row", "electrons", "avg_photon"):
+        return([(z, t, s) for z in Z for t in range(1, z + 1) for s in range(1, 8)])
+    if name in ("all_electrons", "energy_Z"):
+        return([(s,) for s in range(1, 8)])
+    if name == "fluo_yield":
+        return([(z, il) for z in Z for il in range(len(il_groups))])
+    if name == "all_fluo_yield":
+        return([(t, il) for t in range(1, 28) for il in range(len(il_groups))])
+    if name == "avg_photon_table":
+        return([()])
+    return([(z, s) for z in Z for s in range(1, 8)])
+
+
+def cases():
+    # name: (function of one query, array version of the function or None); the transitions are given by their
+    # position in il_groups
+    return({
+        "Z_st_s_idx": (lambda Z, st, s: ee.Z_st_s_idx(ee.fluo_tab, Z, st, s), None),    # bisection in table3
+        "Z_st_s_row": (ee.Z_st_s_row, ee.Z_st_s_rows),  # dense index of table2
+        "electrons": (ee.electrons, lambda Z, st, s: ee.electrons_batch(Z, st, s)[:3]),
+        "all_electrons": (ee.all_electrons, None),
+        "fluo_yield": (lambda Z, g: ee.fluo_yield(Z, il_groups[g]),
+                       lambda Z, g: ee.yield_cube(il_groups)[1][Z[:, None], np.arange(1, 27), g[:, None]]),
+        "all_fluo_yield": (lambda st, g: ee.all_fluo_yield(st, il_groups[g]),
+                           lambda st, g: ee.yield_cube(il_groups)[1][np.arange(5, 31), st[:, None], g[:, None]]),
+        "energy": (ee.energy, None),
+        "energy_st": (ee.energy_st, None),
+        "avg_photon": (ee.avg_photon, lambda Z, st, s: query.answer(Z, st, s)[..., 10:14]),
+        "energy_Z": (ap.energy_Z, None),
+        "avg_photon_table": (lambda: ee.avg_photon_table(None), None),
+    })
+
+
+def _flatten(x):    # any result (nested tuples/ lists of arrays and numbers) as one array of floats
+    if isinstance(x, np.ndarray) and x.dtype.kind == "i" and len(x) > 1 and (np.diff(x) == 1).all():
+        return(np.array([x[0], len(x)], dtype = float)) # blocks of consecutive rows (Z_st_s_idx): first row and length
+    if isinstance(x, (tuple, list)):
+        return(np.concatenate([[len(x)]] + [_flatten(y) for y in x]))
+    return(np.asarray(x, dtype = float).ravel())
+
+
+def _time(func, repeat = 3):  # best of repeat runs, in seconds
+    best = np.inf
+    for i in range(repeat):
+        t = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t)
+    return(best)
+
+
+def _per_call(func):    # time of one call, with enough calls for a precise timing
+    number = 1
+    while _time(lambda: [func() for i in range(number)], 1) < 0.05:
+        number *= 10
+    return(_time(lambda: [func() for i in range(number)])/number)
+
+
+def startup_times():
+    # the text tables are parsed with an empty cache directory for each run, made in a temporary directory that is
+    # removed at the end (given to the new processes by the environment variable BENCHMARK_CACHE)
+    code = {"import": "import emitted_electrons, avg_photon",
+            "load (cached)": "import emitted_electrons as ee; ee.load_tables()",
+            "load (text tables)": "import emitted_electrons as ee, tempfile, os; ee.cache_dir = tempfile.mkdtemp(dir = os.environ['BENCHMARK_CACHE']); ee.load_tables()"}
+    subprocess.run([sys.executable, "-c", code["load (cached)"]], cwd = ee.data_dir, check = True)  # the binary copies exist
+    times = {}
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict(os.environ, BENCHMARK_CACHE = cache)
+        for name, c in code.items():
+            times[name] = _time(lambda: subprocess.run([sys.executable, "-c", c], cwd = ee.data_dir, env = env, check = True))
+    times["interpreter"] = _time(lambda: subprocess.run([sys.executable, "-c", "pass"], check = True))
+    return(times)
+
+
+def _run_case(name, single, batch, sizes, repeat, cache_size, timings, results):
+    grid = _grid(name)
+    args = grid[len(grid)//2]
+    t = _per_call(lambda: single(*args))
+    timings.append({"function": name, "case": "single", "size": 1, "seconds": t, "us_per_query": t*1e6})
+    if name in ee.cache_info():   # memoized function: also the time of a query found in the cache
+        ee.set_cache_size(max(cache_size, 1))
+        single(*args)
+        t = _per_call(lambda: single(*args))
+        timings.append({"function": name, "case": "single (cached)", "size": 1, "seconds": t, "us_per_query": t*1e6})
+        ee.set_cache_size(0)
+    
+    results[name + ":grid"] = _flatten([single(*a) for a in grid])
+    t = _time(lambda: [single(*a) for a in grid], repeat)
+    timings.append({"function": name, "case": "grid", "size": len(grid), "seconds": t, "us_per_query": t/len(grid)*1e6})
+    if name == "avg_photon_table":
+        return
+    
+    for size in sizes:
+        q = queries(name, size)
+        if batch is not None:
+            case = "batch (array)"
+            func = lambda: batch(*q)
+        else:
+            case = "batch (loop)"
+            items = [tuple(int(a[i]) for a in q) for i in range(size)]
+            func = lambda: [single(*a) for a in items]
+        t = _time(func, repeat if size < 10**5 else 1)
+        timings.append({"function": name, "case": case, "size": size, "seconds": t, "us_per_query": t/size*1e6})
+    q = queries(name, check_size)
+    if batch is not None:
+        results[name + ":batch"] = _flatten(batch(*q))
+    else:
+        results[name + ":batch"] = _flatten([single(*tuple(int(a[i]) for a in q)) for i in range(check_size)])
+
+
+def run(sizes = (1, 100, 10**4, 10**6), repeat = 3):
+    ee.load_tables()
+    ap.load_tab()
+    timings = []
+    results = {}
+    cache_size = ee.cache_size
+    ee.set_cache_size(0)    # no memoization: the repeated calls are not answered from the cache
+    try:
+        for name, (single, batch) in cases().items():
+            _run_case(name, single, batch, sizes, repeat, cache_size, timings, results)
+    finally:
+        ee.set_cache_size(cache_size)
+    return(timings, results)
+
+
+def check(results, reference, rtol = 1e-9, atol = 1e-12):
+    drift = []
+    for key in sorted(set(results) | set(reference)):
+        if key not in results or key not in reference:
+            drift.append(key)
+        elif results[key].shape != reference[key].shape or not np.allclose(results[key], reference[key], rtol = rtol, atol = atol, equal_nan = True):
+            drift.append(key)
+    return(drift)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmarks and regression check of the emitted electrons and photons")
+    parser.add_argument("--sizes", default = "1,100,10000,1000000", help = "batch sizes, separated by commas")
+    parser.add_argument("--repeat", type = int, default = 3, help = "runs of each timing (the best is kept)")
+    parser.add_argument("--json", help = "file for the timings (JSON)")
+    parser.add_argument("--update", action = "store_true", help = "write the reference file with the current results")
+    parser.add_argument("--no-startup", action = "store_true", help = "skip the import and loading times")
+    args = parser.parse_args(argv)
+    
+    report = {}
+    if not args.no_startup:
+        report["startup"] = startup_times()
+        print("Startup (s, best of 3, new processes):")
+        for name, t in report["startup"].items():
+            print("  %-20s %8.4f" % (name, t))
+    
+    timings, results = run([int(n) for n in args.sizes.split(",")], args.repeat)
+    report["timings"] = timings
+    print("%-18s %-15s %9s %12s %14s" % ("function", "case", "size", "seconds", "us per query"))
+    for t in timings:
+        print("%-18s %-15s %9d %12.6f %14.3f" % (t["function"], t["case"], t["size"], t["seconds"], t["us_per_query"]))
+    
+    if args.update:
+        np.savez_compressed(reference_file, **results)
+        print("reference written:", reference_file)
+        drift = []
+    else:
+        with np.load(reference_file) as reference:
+            drift = check(results, dict(reference))
+        report["drift"] = drift
+        print("results different from the reference:" if drift else "results identical to the reference", *drift)
+    
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent = 1)
+    return(1 if drift else 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+
+"""
+Applications of the functions
+"""
+
+# Timings only, without the largest batches:
+#timings, results = run(sizes = (1, 100, 10000))
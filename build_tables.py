@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Incremental build of the derived table avg_photons_electrons2 (avg_photon_table), with a provenance manifest
+
+Each row of the derived table only depends on one row of table2 and on the fluorescence transitions of table3 of
+the same (Z, st, s) (its cascade). The build hashes these input rows for every (Z, st, s) group and keeps, in the
+manifest next to the table (avg_photons_electrons2.manifest.json), the hash, the rows of table2 and table3 used and
+the result of each group. When it is run again, only the groups whose hash changed (or which are new) are
+computed again; the other rows are taken from the manifest. Every group is computed again when the code of
+emitted_electrons.py or the precision of its compact tables has changed.
+
+Usage:
+python build_tables.py            # builds or updates avg_photons_electrons2
+python build_tables.py --force    # computes every group
+
+Recap of all functions:
+
+group_hashes(): hash of the input rows, row of table2 and rows of table3 of every (Z, st, s) group of table2
+manifest_path(filename): manifest of a derived table
+build(filename, force): updates the table and its manifest, returns the (Z, st, s) of the groups computed again
+main(argv): the command-line tool
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+import emitted_electrons as ee
+import avg_photon as ap
+
+
+def _file_digest(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return(h.hexdigest())
+
+
+def group_hashes():
+    # {(Z, st, s): (hash, row of table2, [first, last + 1] rows of table3 in the file)}, in the order of table2
+    ee.load_tables()
+    table = np.ascontiguousarray(ee.table, dtype = float)
+    fluo_tab = np.ascontiguousarray(ee.fluo_tab, dtype = float)
+    start, stop = ee.build_index(fluo_tab)  # table3 is sorted by Z, st and s: the transitions of a group are contiguous
+    hashes = {}
+    for row, key in enumerate(ee.key_columns(ee.auger_tab).tolist()):
+        first, last = int(start[tuple(key)]), int(stop[tuple(key)])
+        first, last = (first, last) if first >= 0 else (0, 0)
+        h = hashlib.sha1(table[row].tobytes())
+        h.update(fluo_tab[first:last].tobytes())
+        hashes[tuple(key)] = (h.hexdigest(), row, [first, last])
+    return(hashes)
+
+
+def manifest_path(filename = "avg_photons_electrons2"):
+    return(os.path.join(ee.data_dir, filename + ".manifest.json"))
+
+
+def _write(path, write):    # written next to the final file then renamed, so that it is never read half-written
+    tmp = path + ".%d.tmp" % os.getpid()
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def build(filename = "avg_photons_electrons2", force = False):
+    ee.load_tables()
+    with open(ee.__file__, "rb") as f:
+        code = hashlib.sha1(f.read()).hexdigest()
+    settings = {"code": code, "precision": np.dtype(ee.precision).name}
+    
+    previous = {}
+    path = manifest_path(filename)
+    if os.path.exists(path) and not force:
+        with open(path) as f:
+            manifest = json.load(f)
+        if all(manifest.get(k) == v for k, v in settings.items()):
+            previous = manifest["groups"]
+    
+    hashes = group_hashes()
+    groups = {}
+    changed = []
+    for key, (h, row, rows3) in hashes.items():
+        name = "%d %d %d" % key
+        old = previous.get(name)
+        if old is not None and old["hash"] == h:
+            groups[name] = old
+        else:
+            groups[name] = {"hash": h, "table2_row": row, "table3_rows": rows3}
+            changed.append(key)
+    results = ee.avg_photon_table(None, [hashes[key][1] for key in changed])
+    for key, result in zip(changed, results.tolist()):
+        groups["%d %d %d" % key]["result"] = result
+    
+    table_path = os.path.join(ee.data_dir, filename)
+    if changed or len(groups) != len(previous) or not os.path.exists(table_path):
+        energy_tab = np.array([groups["%d %d %d" % key]["result"] for key in hashes])
+        _write(table_path, lambda tmp: np.savetxt(tmp, energy_tab, fmt = ee.avg_photon_fmt))
+        with ap._load_lock:
+            ap._loaded = False  # avg_photon.py reads the new table when it is next used
+    
+    header = dict(settings)
+    header.update({"table": filename, "built": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                   "inputs": {name: _file_digest(os.path.join(ee.data_dir, name)) for name in ("table2", "table3")},
+                   "computed": ["%d %d %d" % key for key in changed]})
+    
+    def write_manifest(tmp):   # one line per group, so that the differences between two builds are easy to read
+        with open(tmp, "w") as f:
+            f.write(json.dumps(header, indent = 1)[:-2] + ',\n "groups": {\n')
+            f.write(",\n".join("  %s: %s" % (json.dumps(name), json.dumps(g)) for name, g in groups.items()))
+            f.write("\n }\n}\n")
+    _write(path, write_manifest)
+    return(changed)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Incremental build of the table of the mean number and energy of the emitted electrons and photons")
+    parser.add_argument("--filename", default = "avg_photons_electrons2", help = "derived table (next to table2 and table3)")
+    parser.add_argument("--force", action = "store_true", help = "compute every group again")
+    args = parser.parse_args(argv)
+    changed = build(args.filename, args.force)
+    print("%d groups computed, manifest: %s" % (len(changed), manifest_path(args.filename)))
+    return(0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+
+"""
+Applications of the functions
+"""
+
+# After editing the yields of table3 for Fe (Z = 26), only the Fe groups are computed again:
+#changed = build()
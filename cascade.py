@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo sampling of the decay of inner-shell vacancies, event by event
+
+For an ion (Z, st) with an initial vacancy s, the number n of emitted electrons (1-10, photo-electron included)
+is drawn from the probabilities of table2, so the ion ends in the ionisation stage st + n after n - 1 Auger
+electrons. The photons are then drawn from the transitions of table3 with delta = n - 1: each transition emits
+int(w) photons, plus one more with probability w - int(w), so that the mean number and energy of the photons are
+the ones of avg_photon.
+
+Recap of all functions:
+
+alias_tables(): Walker alias tables of the number of emitted electrons, one for each row of table2
+photon_groups(): transitions of table3 grouped by row of table2 and delta (offsets of each group in the sorted transitions)
+sample_cascades(Z, st, s, size, seed): number of Auger electrons, final ionisation stage and emitted photons of many events
+"""
+
+import numpy as np
+import emitted_electrons as ee
+
+_alias = None
+_groups = None
+_draws = None
+
+
+@ee.on_reload
+def _clear():   # the tables were reloaded (set_precision, shared_tables.attach)
+    global _alias, _groups, _draws
+    _alias = _groups = _draws = None
+
+
+def alias_tables():    # prob[row, k], alias[row, k]: bin k is kept with probability prob, otherwise replaced by its alias
+    global _alias
+    if _alias is not None:
+        return(_alias)
+    ee.load_tables()
+    proba = ee.auger_tab["counts"]/10000
+    proba = proba/proba.sum(axis=1)[:, None]    # the probabilities of table2 are rounded, their sum is not always exactly 1
+    n_bins = proba.shape[1]
+    prob = np.ones(proba.shape)
+    alias = np.tile(np.arange(n_bins, dtype = np.int8), (len(proba), 1))
+    
+    for row in range(len(proba)):   # Vose's method
+        scaled = proba[row]*n_bins
+        small = [k for k in range(n_bins) if scaled[k] < 1]
+        large = [k for k in range(n_bins) if scaled[k] >= 1]
+        while small and large:
+            k, l = small.pop(), large.pop()
+            prob[row, k] = scaled[k]
+            alias[row, k] = l
+            scaled[l] -= 1 - scaled[k]
+            if scaled[l] < 1:
+                small.append(l)
+            else:
+                large.append(l)
+    _alias = (prob, alias)
+    return(_alias)
+
+
+def photon_groups():   # offsets, yields, photon energies and transition types of the table3 rows sorted by (row of table2, delta)
+    global _groups
+    if _groups is not None:
+        return(_groups)
+    ee.load_tables()
+    keys = ee.key_columns(ee.fluo_lines, 4)    # table3 sorted by (Z, st, s, delta, il), i.e. by (row of table2, delta)
+    rows = ee.row_idx[keys[:, 0], keys[:, 1], keys[:, 2]]
+    lines = np.flatnonzero(rows >= 0)   # some transitions of table3 have no corresponding row in table2
+    group = rows[lines]*10 + keys[lines, 3]
+    
+    offsets = np.zeros(len(ee.auger_tab)*10 + 1, dtype = int)
+    offsets[1:] = np.cumsum(np.bincount(group, minlength = len(ee.auger_tab)*10))
+    E = ee.fluo_E[lines]
+    lines = ee.fluo_lines[lines]
+    _groups = (offsets, lines["w"].astype(float), E, lines["il"].astype(int))
+    return(_groups)
+
+
+def _photon_draws():
+    # each transition emits int(w) photons, plus one with probability p = w - int(w). For the random part, first[i] is
+    # group + probability that one of the transitions of the group up to i emits, so that one uniform number u picks
+    # the first emitting transition of an event (np.searchsorted(first, group + u)), or none if u >= some[group]
+    global _draws
+    if _draws is not None:
+        return(_draws)
+    offsets, w, E_p, il = photon_groups()
+    group = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    m = w.astype(int)
+    p = w - m
+    
+    log_none = np.cumsum(np.log1p(-p))
+    before = np.append(0, log_none)[offsets[:-1]]  # value of the cumulative sum before each group
+    first = group + 1 - np.exp(log_none - before[group])
+    some = 1 - np.exp(np.append(0, log_none)[offsets[1:]] - before)  # probability that at least one transition emits
+    
+    fixed = np.flatnonzero(m > 0)   # transitions with w >= 1
+    fixed_offsets = np.zeros(len(offsets), dtype = int)
+    fixed_offsets[1:] = np.cumsum(np.bincount(group[fixed], minlength = len(offsets) - 1))
+    _draws = (p, first, some, fixed, m[fixed], fixed_offsets)
+    return(_draws)
+
+
+def _expand(start, stop):  # all the indexes start[i] <= j < stop[i], and the i they belong to
+    count = stop - start
+    which = np.repeat(np.arange(len(start)), count)
+    idx = np.arange(len(which)) - np.repeat(np.cumsum(count) - count - start, count)
+    return(which, idx)
+
+
+def sample_cascades(Z, st, s, size = None, seed = None):
+    # Z, st and s are broadcast together (and to size if given), one event for each element
+    # returns n_auger and final_st (-1 for the combinations missing from table2), the number of photons of each
+    # event, and for every photon its event (in the flattened events), energy and transition type (sorted by event)
+    rng = np.random.default_rng(seed)
+    rows = ee.Z_st_s_rows(Z, st, s)  # looked up before broadcasting to size
+    st = np.broadcast_to(st, rows.shape)
+    if size is not None:
+        rows, st = np.broadcast_to(rows, size), np.broadcast_to(st, size)
+    shape = rows.shape
+    rows, st = rows.ravel(), st.ravel()
+    valid = rows >= 0
+    r = np.where(valid, rows, 0)
+    prob, alias = alias_tables()
+    
+    # number of emitted electrons (0-9 for 1-10 electrons), one random number per event
+    x = rng.random(len(rows))*prob.shape[1]
+    k = x.astype(int)
+    bins = r*prob.shape[1] + k
+    n = np.where(x - k < prob.ravel()[bins], k, alias.ravel()[bins])
+    n_auger = np.where(valid, n, -1)
+    final_st = np.where(valid, st + n + 1, -1)
+    
+    # photons: the table3 transitions of the event's row of table2 with delta = number of Auger electrons
+    offsets, w, E_p, il = photon_groups()
+    p, first, some, fixed, fixed_m, fixed_offsets = _photon_draws()
+    group = r*10 + n
+    
+    u = rng.random(len(rows))
+    hit = np.flatnonzero(valid & (u < some[group]))    # events where at least one transition emits a photon at random
+    j = np.searchsorted(first, group[hit] + u[hit], side = "right")  # first of them
+    which, after = _expand(j + 1, offsets[group[hit] + 1])   # the following ones are independent
+    emit = rng.random(len(after)) < p[after]
+    
+    with_fixed = np.flatnonzero(valid & (fixed_offsets[group + 1] > fixed_offsets[group])) if len(fixed) else np.zeros(0, dtype = int)
+    which_fixed, f = _expand(fixed_offsets[group[with_fixed]], fixed_offsets[group[with_fixed] + 1])
+    
+    photon_event = np.concatenate((hit, hit[which[emit]], np.repeat(with_fixed[which_fixed], fixed_m[f])))
+    photon_lines = np.concatenate((j, after[emit], np.repeat(fixed[f], fixed_m[f])))
+    order = np.lexsort((photon_lines, photon_event))
+    photon_event, photon_lines = photon_event[order], photon_lines[order]
+    n_photons = np.bincount(photon_event, minlength = len(rows))
+    
+    return(n_auger.reshape(shape), final_st.reshape(shape), n_photons.reshape(shape), photon_event, E_p[photon_lines], il[photon_lines])
+
+
+
+"""
+Applications of the functions
+"""
+
+# 10 million K-shell vacancies of Fe I:
+#n_auger, final_st, n_photons, photon_event, photon_energy, photon_il = sample_cascades(26, 1, 1, size = 10**7, seed = 1)
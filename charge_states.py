@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Redistribution of the ions over the ionisation stages after an inner-shell vacancy (table2)
+
+An ion in the stage st with an initial vacancy s emits n electrons (1-10, photo-electron included) with the
+probabilities of table2 and ends in the stage st + n. For an element Z the stages 1 to Z+1 (bare nucleus) are the
+rows/ columns 0 to Z of the matrices: column st-1 gives where the ions of the stage st go.
+
+Recap of all functions:
+
+redistribution_matrices(Z): sparse (CSR) redistribution matrix of each initial vacancy s = 1-7 (list of 7 matrices)
+rate_matrix(Z, rates): sparse rate matrix dn/dt = A n for vacancy rates per shell (7) or per shell and stage (7, Z+1)
+
+All the elements Z = 4-30 together (one vector with the stages 1 to Z+1 of every element, see stage_offsets):
+stage_offsets(): position of the stage 1 of each element in the vector of all ions
+block_rate_matrix(rates): block-diagonal sparse rate matrix of all the elements
+evolve(n0, rates, times, per_cell, chunk): ion fractions of all the elements at the given times, for one or many cells
+    (the same rates for all of them, or one set of rates per cell)
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import expm_multiply
+import emitted_electrons as ee
+
+_patterns = {}
+_block = None
+
+
+@ee.on_reload
+def _clear():   # the tables were reloaded (set_precision, shared_tables.attach)
+    global _block
+    _patterns.clear()
+    _block = None
+
+
+def _pattern(Z):
+    # every (final stage, initial stage, shell, probability) of the element, with minus the total on the diagonal for the
+    # ions leaving their stage, and the slot of each of them in the data of the CSR rate matrix
+    if Z in _patterns:
+        return(_patterns[Z])
+    ee.load_tables()
+    start, stop = np.searchsorted(ee.auger_tab["Z"], [Z, Z+1])
+    rows = ee.auger_tab[start:stop]
+    st = rows["st"].astype(int)
+    s = rows["s"].astype(int)
+    proba = rows["counts"]/10000
+    n_st, n_e = np.nonzero(proba)
+    
+    final = np.concatenate((st[n_st] + n_e, st - 1))   # st + n - 1 with n = n_e + 1
+    initial = np.concatenate((st[n_st] - 1, st - 1))
+    shell = np.concatenate((s[n_st], s))
+    value = np.concatenate((proba[n_st, n_e], -proba.sum(axis=1)))    # the rounded probabilities do not always add up to 1, the ions are conserved
+    
+    size = Z + 1
+    keys, slot = np.unique(final*size + initial, return_inverse = True)
+    indices = keys % size
+    indptr = np.searchsorted(keys//size, np.arange(size + 1))
+    _patterns[Z] = (final, initial, shell, value, slot, indices, indptr)
+    return(_patterns[Z])
+
+
+def redistribution_matrices(Z):
+    final, initial, shell, value, slot, indices, indptr = _pattern(Z)
+    matrices = []
+    for s in range(1, 8):
+        keep = (shell == s) & (value > 0)
+        matrices.append(sparse.csr_matrix((value[keep], (final[keep], initial[keep])), shape = (Z+1, Z+1)))
+    return(matrices)
+
+
+def rate_matrix(Z, rates):
+    # rates[s-1] (or rates[s-1, st-1]) is the number of vacancies per second and per ion in the shell s
+    final, initial, shell, value, slot, indices, indptr = _pattern(Z)
+    rates = np.asarray(rates, dtype = float)
+    if rates.ndim == 1:
+        coef = rates[shell - 1]
+    else:
+        coef = rates[shell - 1, initial]
+    data = np.bincount(slot, weights = value*coef, minlength = len(indices))
+    return(sparse.csr_matrix((data, indices, indptr), shape = (Z+1, Z+1)))
+
+
+
+def stage_offsets():    # offsets[Z] + st - 1 is the position of the stage st of the element Z (Z = 4-30, offsets[31] = size)
+    offsets = np.zeros(32, dtype = int)
+    offsets[5:] = np.cumsum(np.arange(4, 31) + 1)
+    return(offsets)
+
+
+def _block_pattern():  # the patterns of all the elements, moved to their place in the vector of all ions
+    global _block
+    if _block is not None:
+        return(_block)
+    offsets = stage_offsets()
+    final, initial, shell, value, element = [], [], [], [], []
+    for Z in range(4, 31):
+        f, i, s, v = _pattern(Z)[:4]
+        final.append(f + offsets[Z])
+        initial.append(i + offsets[Z])
+        shell.append(s)
+        value.append(v)
+        element.append(np.full(len(f), Z))
+    final, initial, shell, value, element = [np.concatenate(a) for a in (final, initial, shell, value, element)]
+    
+    size = offsets[31]
+    keys, slot = np.unique(final*size + initial, return_inverse = True)
+    _block = (final, initial, shell, value, element, slot, keys % size, np.searchsorted(keys//size, np.arange(size + 1)))
+    return(_block)
+
+
+def block_rate_matrix(rates):
+    # rates[s-1] (same for all the ions) or rates[s-1, i] for the ion at the position i of the vector of all ions
+    final, initial, shell, value, element, slot, indices, indptr = _block_pattern()
+    size = stage_offsets()[31]
+    rates = np.asarray(rates, dtype = float)
+    if rates.ndim == 1:
+        coef = rates[shell - 1]
+    else:
+        coef = rates[shell - 1, initial]
+    data = np.bincount(slot, weights = value*coef, minlength = len(indices))
+    return(sparse.csr_matrix((data, indices, indptr), shape = (size, size)))
+
+
+def evolve(n0, rates, times, per_cell = False, chunk = 128):
+    # n0: ion fractions at t = 0, shape (size,) or (size, cells) with size = stage_offsets()[31]
+    # rates: vacancy rates per shell, the same for all cells ((7,) or (7, size)), or one set per cell ((cells, 7)) with
+    # per_cell = True; the cells are then computed chunk by chunk
+    # returns the ion fractions at each time, shape (len(times),) + n0.shape
+    n = np.array(n0, dtype = float)
+    rates = np.asarray(rates, dtype = float)
+    times = np.asarray(times, dtype = float)
+    steps = np.diff(np.append(0, times))
+    result = np.empty((len(times),) + n.shape)
+    
+    if not per_cell:
+        # same matrix for every cell: exponential of the sparse block-diagonal matrix applied to all cells at once
+        A = block_rate_matrix(rates).tocsc()
+        for i in range(len(times)):
+            if steps[i] != 0:
+                n = expm_multiply(A*steps[i], n)
+            result[i] = n
+        return(result)
+    
+    if rates.ndim != 2 or rates.shape[1] != 7 or n.ndim != 2 or n.shape[1] != rates.shape[0]:
+        raise ValueError("per_cell: rates must have the shape (cells, 7) and n0 the shape (size, cells)")
+    final, initial, shell, value, element, slot, indices, indptr = _block_pattern()
+    offsets = stage_offsets()
+    Z = np.repeat(np.arange(4, 31), np.arange(4, 31) + 1)   # element and stage of every position of the vector of all ions
+    st = np.arange(offsets[31]) - offsets[Z]
+    for first in range(0, rates.shape[0], chunk):
+        # one dense matrix per cell and element (elements padded to 31 stages), for a chunk of cells
+        r = rates[first:first + chunk]
+        A = np.zeros((len(r), 27, 31, 31))
+        np.add.at(A, (slice(None), element - 4, final - offsets[element], initial - offsets[element]), value*r[:, shell - 1])
+        padded = np.zeros((len(r), 27, 31))
+        padded[:, Z - 4, st] = n[:, first:first + chunk].T
+        propagators = {}    # exp(A step) of each length of step
+        for i in range(len(times)):
+            if steps[i] != 0:
+                if steps[i] not in propagators:
+                    propagators[steps[i]] = _expm_batch(A*steps[i])
+                padded = (propagators[steps[i]] @ padded[..., None])[..., 0]
+            result[i][:, first:first + chunk] = padded[:, Z - 4, st].T
+    return(result)
+
+
+def _expm_batch(A):
+    # exp(A) for a batch of matrices A[..., :, :], by scaling and squaring: Taylor series of degree 12 for A/2**k
+    # with |A/2**k| <= 1/4 (error < 1e-17), then k squarings, so the cost only grows as log2(|A|). The rate
+    # matrices conserve the ions (their exponentials are stochastic), so the squarings do not amplify the error
+    norm = np.abs(A).sum(axis=-2).max() if A.size else 0.
+    k = max(0, int(np.ceil(np.log2(norm/0.25)))) if norm > 0 else 0
+    B = A/2.**k
+    identity = np.eye(A.shape[-1])
+    E = identity + B/12
+    for j in range(11, 0, -1):  # Horner scheme
+        E = identity + (B @ E)/j
+    for i in range(k):
+        E = E @ E
+    return(E)
+
+
+"""
+Applications of the functions
+"""
+
+# Redistribution of the iron ions after a K-shell vacancy:
+#M = redistribution_matrices(26)[0]
+
+# Iron ions with 1 K-shell and 10 L_1-shell vacancies per second and per ion:
+#A = rate_matrix(26, [1, 10, 0, 0, 0, 0, 0])
+
+# All the elements starting neutral, under the same vacancy rates, at 100 times:
+#offsets = stage_offsets()
+#n0 = np.zeros(offsets[31])
+#n0[offsets[4:31]] = 1
+#n = evolve(n0, [1, 10, 0, 0, 0, 0, 0], np.linspace(0, 1, 100))
+
+# 1000 cells, each with its own rates:
+#rates = np.random.default_rng(1).uniform(0, 10, (1000, 7))
+#n = evolve(np.repeat(n0[:, None], 1000, axis=1), rates, [0.1, 1], per_cell = True)
@@ -16,369 +16,554 @@ w: fluorescence yield
 
 Recap of all functions:
 
+load_table(filename, dtype): reads a text table, using a binary copy (in __tablecache__) when it is up to date
 correspondence(Z, st, s, il): used to give the details of each ionisation in the graph legend/ title
 Z_st_s_idx(table, Z, st, s): returns indexes of Z, st and s for chosen table
+build_index(tab): dense (Z, st, s) index giving the first and last+1 rows of each group of a table
+compact(tab, dtype): structured copy of a 2-D table (table2_dtype(precision), table3_dtype(precision))
+key_columns(tab, n): the first n key columns (Z, st, s, delta, il) of a 2-D or compact table as integers
+load_tables(): reads and indexes the tables (done by every function when first needed); the functions use the
+    compact copies auger_tab (table2) and fluo_lines (table3 sorted by (Z, st, s, delta, il)), with the offsets,
+    the sums of the yields and the sums of yield x energy of each (Z, st, s, delta) group of transitions; the
+    results (energies of table2, energy sort keys and bins of the lines, fluo_E) use the float64 values of the text tables
+set_precision(dtype): float type of the energies and yields of the compact tables (np.float32 by default)
+electron_statistics(proba): mean, variance, skewness, CDF, mode and quantiles of the number of emitted electrons for
+    rows of probabilities, with ([..., 0]) and without ([..., 1]) the photo-electron; electron_stats[Z, st, s] holds them for all of table2
+Z_st_s_row(Z, st, s): row of table2 for a given element, ionisation stage and initial vacancy (-1 if it does not exist)
+
+Z_st_s_rows(Z, st, s): same as Z_st_s_row for arrays
 
 electrons(Z, st, s): number distribution of emitted electrons for a given element, ionisation stage and initial inner-shell vacancy.
+electrons_batch(Z, st, s): number distributions, mean and variance of the number of emitted electrons for arrays of Z, st and s.
 all_electrons(S): mean number distribution of emitted electrons for all neutral atoms and a given inner shell.
 fluo_yield(Z, il): fluorescence yield for all ions of an element.
+yield_cube(groups): fluorescence yields w[Z, st, g] of all ions for groups of transitions (line_groups: K alpha, K beta, L and M lines)
 energy(Z, s): energy distribution (ionisation and Auger electron) for all ions of a given element and inner shell.
 energy_st(Z, s): energy per number of electrons for a given ionisation stage of an element and a given inner shell.
 all_fluo_yield(st, il): fluorescence yield for all enutral atoms for a given fluorescence transition.
 
 avg_photon(Z, st, s): was used to obtain the table with the mean number of electrons and the mean number and photons energy
+clear_caches(), set_cache_size(maxsize), cache_info(): the results of fluo_yield, energy, energy_st and avg_photon are
+    memoized (least recently used ones evicted beyond cache_size, read-only arrays), and cleared when the tables are reloaded
+on_reload(func): registers a function clearing a cache of another module, called with clear_caches()
+avg_photon_table(filename, rows): avg_photon for every row of table2 (or some rows) at once, written to the table used by avg_photon.py
+
+The functions only compute (they return NumPy arrays); the graphs are drawn by graphs.py.
 """
 
+import os
+import operator
+import threading
+import functools
+from collections import OrderedDict
 import numpy as np
-import matplotlib.pylab as plt
 
-table = np.loadtxt("table2")   # importing the data
-elements = np.loadtxt("elements_names", dtype = str)    # importing the names of Z, st and s (used in the legend of the graphs)
-stages = np.loadtxt("ionisation_stages", dtype = str)
-gaps = np.loadtxt("initial_gap", dtype = str)
-ils = np.loadtxt("il", dtype = str)
-fluo_tab = np.loadtxt("table3")
+data_dir = os.path.dirname(os.path.abspath(__file__))  # the tables are next to this file
+cache_dir = os.path.join(data_dir, "__tablecache__")
+
+
+def load_table(filename, dtype = float):
+    # the text tables are parsed once and saved as .npy files; the copy is used as long as its modification
+    # time is the one of the text file (it is set to it when the copy is written)
+    path = os.path.join(data_dir, filename)
+    cache = os.path.join(cache_dir, os.path.basename(filename) + ".npy")
+    mtime = os.stat(path).st_mtime_ns
+    try:
+        if os.stat(cache).st_mtime_ns == mtime:
+            return(np.load(cache, mmap_mode = "r" if dtype == float else None))
+    except (OSError, ValueError):
+        pass    # no copy yet (or an unreadable one)
+    
+    data = np.loadtxt(path, dtype = dtype)
+    try:
+        os.makedirs(cache_dir, exist_ok = True)
+        tmp = cache + ".%d.tmp" % os.getpid()  # written next to the final file then renamed, so other processes never read half a file
+        with open(tmp, "wb") as f:
+            np.save(f, data)
+        os.utime(tmp, ns = (mtime, mtime))
+        os.replace(tmp, cache)
+    except OSError:
+        pass    # read-only directory: the text table is parsed every time
+    return(data)
+
+
+def table2_dtype(precision = np.float32):   # Z, st, s, ionisation energy, Auger electron energy, column 6 and the 1-10 electrons counts (x10000)
+    return(np.dtype([("Z", "u1"), ("st", "u1"), ("s", "u1"), ("I", precision), ("E_e", precision), ("extra", "i2"), ("counts", "u2", (10,))]))
+
+
+def table3_dtype(precision = np.float32):   # Z, st, s, delta, il, photon energy and fluorescence yield
+    return(np.dtype([("Z", "u1"), ("st", "u1"), ("s", "u1"), ("delta", "u1"), ("il", "u1"), ("E", precision), ("w", precision)]))
+
+
+def compact(tab, dtype):    # one field for each column (or group of columns) of the table, in order
+    out = np.empty(len(tab), dtype = dtype)
+    col = 0
+    for name in dtype.names:
+        shape = dtype[name].shape
+        if shape:
+            out[name] = tab[:, col:col+shape[0]]
+            col += shape[0]
+        else:
+            out[name] = tab[:, col]
+            col += 1
+    return(out)
+
+
+def key_columns(tab, n = 3):  # the keys are the first columns (fields) of both kinds of tables
+    if tab.dtype.names is None:
+        return(tab[:, :n].astype(int))
+    return(np.column_stack([tab[name] for name in tab.dtype.names[:n]]).astype(int))
+
+
+quantile_levels = np.array([0.05, 0.25, 0.5, 0.75, 0.95])
+
+
+def stats_dtype():
+    return(np.dtype([("mean", "f8", (2,)), ("variance", "f8", (2,)), ("skewness", "f8", (2,)), ("mode", "f8", (2,)),
+                     ("cdf", "f8", (10,)), ("quantiles", "f8", (2, len(quantile_levels)))]))
+
+
+def electron_statistics(proba):
+    # proba[..., 10]: probabilities to emit 1-10 electrons; [..., 0] counts the photo-electron (n = 1-10), [..., 1] only
+    # the Auger electrons (n = 0-9). The rounded probabilities of table2 are used as they are (their sum is not always 1)
+    proba = np.asarray(proba, dtype = float)
+    n = np.arange(1, 11)
+    powers = np.stack([n**0, n, n**2, n**3, n - 1, (n - 1)**2, (n - 1)**3], axis=1)
+    m = proba @ powers  # all the moments in one product
+    stats = np.empty(proba.shape[:-1], dtype = stats_dtype())
+    m0 = m[..., 0]
+    for k, (m1, m2, m3) in enumerate(((m[..., 1], m[..., 2], m[..., 3]), (m[..., 4], m[..., 5], m[..., 6]))):
+        variance = np.maximum(m2 - m1**2, 0)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            skewness = (m3 - 3*m1*m2 + 3*m1**3 - m0*m1**3)/variance**1.5   # sum of p*(n - mean)**3
+        stats["mean"][..., k] = m1
+        stats["variance"][..., k] = variance
+        stats["skewness"][..., k] = np.where(variance > 0, skewness, 0)   # 0 for a single number of electrons
+    
+    cdf = np.cumsum(proba, axis=-1)
+    stats["cdf"] = cdf
+    mode = np.argmax(proba, axis=-1) + 1.
+    # smallest n with P(N <= n) >= level (the CDF is normalised for the quantiles)
+    quantiles = (cdf[..., None, :]/cdf[..., -1:, None] < quantile_levels[:, None]).sum(axis=-1) + 1.
+    missing = np.isnan(proba).any(axis=-1)
+    mode[missing] = np.nan
+    quantiles[missing] = np.nan
+    stats["mode"] = np.stack((mode, mode - 1), axis=-1)
+    stats["quantiles"] = np.stack((quantiles, quantiles - 1), axis=-2)
+    return(stats)
+
+
+line_groups = {"K alpha": (1, 2), "K beta": (3, 4), "L": tuple(range(5, 16)), "M": tuple(range(16, 23))}   # il of each group
+N_Z, N_ST, N_S = 31, 31, 8  # size of the dense indexes (Z: 0-30, st: 0-30, s: 0-7)
+N_DELTA, N_IL = 10, 23  # delta: 0-9, il: 0-22
+precision = np.float32  # energies and yields of the compact tables; np.float64 keeps the exact values of the text tables
+_table_names = ("table", "elements", "stages", "gaps", "ils", "fluo_tab", "auger_tab", "row_idx", "fluo_start", "fluo_stop",
+                "fluo_lines", "fluo_E", "fluo_offsets", "fluo_groups", "fluo_group_idx", "fluo_w_sum", "fluo_wE_sum", "fluo_il_w", "fluo_il_n",
+                "electron_stats")
+_loaded = False
+_load_lock = threading.Lock()
+_yield_cubes = {}
+cache_size = 1024   # results kept by each memoized function (the least recently used ones are evicted); 0: no memoization
+_caches = {}    # memoized function -> its results and statistics
+_cache_lock = threading.Lock()
+_generation = 0 # incremented when the caches are cleared (a result computed with the previous tables is not kept)
+_reload_hooks = []  # functions clearing the caches of the other modules
+_missing = object()
+
+
+def load_tables():  # the tables are only read (and indexed) when a function first needs them
+    if _loaded:
+        return
+    with _load_lock:
+        if not _loaded:    # another thread may have loaded them while we were waiting
+            _load_tables()
+
+
+def set_precision(dtype):  # the compact tables are rebuilt if they were already loaded (to be called before the other modules use them)
+    global precision
+    with _load_lock:
+        precision = np.dtype(dtype).type
+        if _loaded:
+            _load_tables()
+
+
+def clear_caches(): # done each time the tables are (re)loaded
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        for cache in _caches.values():
+            cache["entries"].clear()
+    _yield_cubes.clear()
+    for func in list(_reload_hooks):
+        func()
+
+
+def on_reload(func):    # func() is called by clear_caches: for the caches that other modules build from the tables
+    _reload_hooks.append(func)
+    return(func)
+
+
+def set_cache_size(maxsize):
+    global cache_size
+    with _cache_lock:
+        cache_size = maxsize
+        for cache in _caches.values():
+            while len(cache["entries"]) > max(maxsize, 0):
+                cache["entries"].popitem(last = False)
+
+
+def cache_info():   # hits, misses, size and maxsize of the cache of each memoized function
+    with _cache_lock:
+        return({name: {"hits": c["hits"], "misses": c["misses"], "size": len(c["entries"]), "maxsize": cache_size}
+                for name, c in _caches.items()})
+
+
+def _key_arg(x):    # int for an integer, tuple of ints for a sequence (il = 1 and il = (1, 2), [1, 2] or np.array([1, 2]))
+    if type(x) is int:
+        return(x)
+    if type(x) is tuple and all(type(y) is int for y in x):
+        return(x)
+    if isinstance(x, np.ndarray):
+        if x.dtype.kind not in "iu":
+            raise TypeError("not an array of integers")
+        return(x.item() if x.ndim == 0 else tuple(x.ravel().tolist()))
+    if isinstance(x, (list, tuple)):
+        return(tuple([_key_arg(y) for y in x]))
+    return(operator.index(x))   # NumPy integers (TypeError for the other types)
+
+
+def _readonly(result):
+    if isinstance(result, np.ndarray):
+        result.flags.writeable = False
+    elif isinstance(result, tuple):
+        for x in result:
+            _readonly(x)
+    return(result)
+
+
+def _memoized(func):
+    # LRU cache of the results of func, keyed on the normalized arguments; the arrays of the results are read-only
+    # (they are shared by all the callers) and the arguments that cannot be normalized are not memoized
+    cache = _caches[func.__name__] = {"entries": OrderedDict(), "hits": 0, "misses": 0}
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            key = tuple([_key_arg(x) for x in args])
+            if kwargs:
+                key += tuple([(k, _key_arg(v)) for k, v in sorted(kwargs.items())])
+        except (TypeError, ValueError):
+            return(func(*args, **kwargs))
+        load_tables()   # before the generation is read (loading the tables clears the caches)
+        entries = cache["entries"]
+        with _cache_lock:
+            result = entries.get(key, _missing)
+            if result is _missing:
+                cache["misses"] += 1
+                generation = _generation
+            else:
+                cache["hits"] += 1
+                entries.move_to_end(key)
+        if result is _missing:
+            result = _readonly(func(*args, **kwargs))
+            with _cache_lock:
+                if cache_size > 0 and generation == _generation:
+                    entries[key] = result
+                    while len(entries) > cache_size:
+                        entries.popitem(last = False)
+        return(list(result) if isinstance(result, list) else result)    # lists (avg_photon of a missing ion) are copied
+    return(wrapper)
+
+
+def _load_tables():
+    global table, elements, stages, gaps, ils, fluo_tab, auger_tab, row_idx, fluo_start, fluo_stop, _loaded
+    global fluo_lines, fluo_E, fluo_offsets, fluo_groups, fluo_group_idx, fluo_w_sum, fluo_wE_sum, fluo_il_w, fluo_il_n, electron_stats, _yield_cubes
+    table = load_table("table2")   # importing the data
+    elements = load_table("elements_names", dtype = str)    # importing the names of Z, st and s (used in the legend of the graphs)
+    stages = load_table("ionisation_stages", dtype = str)
+    gaps = load_table("initial_gap", dtype = str)
+    ils = load_table("il", dtype = str)
+    fluo_tab = load_table("table3")
+    
+    # compact copies used by the functions: uint8 keys, uint16 counts and energies/ yields in the chosen precision
+    auger_tab = compact(table, table2_dtype(precision))
+    row_idx = build_index(auger_tab)[0]    # (Z, st, s) -> row of table2 (each group is a single row)
+    
+    # statistics of the number of emitted electrons of every (Z, st, s), NaN for the combinations missing from table2
+    electron_stats = electron_statistics(np.full((N_Z, N_ST, N_S, 10), np.nan))
+    Z, st, s = key_columns(auger_tab).T
+    electron_stats[Z, st, s] = electron_statistics(auger_tab["counts"]/10000)
+    
+    # table3 sorted by Z, st, s, delta and il: the transitions of each (Z, st, s, delta) group are the rows
+    # fluo_offsets[g]:fluo_offsets[g+1] of fluo_lines, the group g being fluo_group_idx[Z, st, s, delta] (-1 if it does not exist)
+    order = np.lexsort(fluo_tab[:, 4::-1].T)
+    fluo_lines = compact(fluo_tab[order], table3_dtype(precision))
+    fluo_E = fluo_tab[order, 5]   # photon energies of fluo_lines as in table3 (sort keys, bins and sums of the energies)
+    fluo_start, fluo_stop = build_index(fluo_lines)   # (Z, st, s) -> rows of fluo_lines (one row per fluorescence transition)
+    keys = key_columns(fluo_lines, 5)
+    new = np.ones(len(keys), dtype=bool)
+    new[1:] = np.any(keys[1:, :4] != keys[:-1, :4], axis=1)
+    fluo_offsets = np.append(np.flatnonzero(new), len(keys))
+    fluo_groups = keys[new, :4]     # (Z, st, s, delta) of each group
+    fluo_group_idx = np.full((N_Z, N_ST, N_S, N_DELTA), -1, dtype = np.int32)
+    fluo_group_idx[tuple(fluo_groups.T)] = np.arange(len(fluo_groups))
+    w = fluo_lines["w"].astype(float)  # the sums are done in double precision
+    fluo_w_sum = np.add.reduceat(w, fluo_offsets[:-1])    # sum of the fluorescence yields of each group
+    fluo_wE_sum = np.add.reduceat(w*fluo_E, fluo_offsets[:-1])   # sum of yield x photon energy
+    
+    # sum of the yields and number of transitions for each element, ionisation stage and type of transition
+    fluo_il_w = np.zeros((N_Z, N_ST, N_IL))
+    fluo_il_n = np.zeros((N_Z, N_ST, N_IL), dtype=int)
+    np.add.at(fluo_il_w, (keys[:, 0], keys[:, 1], keys[:, 4]), w)
+    np.add.at(fluo_il_n, (keys[:, 0], keys[:, 1], keys[:, 4]), 1)
+    _yield_cubes = {}  # built from the tables above
+    clear_caches()
+    _loaded = True
+
+
+def __getattr__(name):  # emitted_electrons.table etc. load the tables on first access
+    if name in _table_names:
+        load_tables()
+        return(globals()[name])
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 def correspondence(Z, st, s, il):   # used to give the details of each ionisation in the graph legend/ title
+    load_tables()
     il = ils[il-1]
     return elements[Z-1], stages[st-1], gaps[s-1], il
 
-def Z_st_s_idx(table, Z, st, s):
-    Z_idx = np.where(table[:, 0] == Z)
-    Z_idx = Z_idx[0]
-    
-    if len(Z_idx) > 1 :
-        st_idx = np.where(table[Z_idx[0]:Z_idx[len(Z_idx)-1]+1, 1] == st)
-    elif (len(Z_idx) == 1):
-        st_idx = np.where(table[Z_idx[0], 1] == st)
-    st_idx = st_idx[0]
+def Z_st_s_idx(table, Z, st, s):   # the tables are sorted by Z, st and s, so each selection is a contiguous block found by bisection
+    Z_col, st_col, s_col = [table[:, i] if table.dtype.names is None else table[table.dtype.names[i]] for i in range(3)]
+    z0, z1 = np.searchsorted(Z_col, [Z, Z+1])
+    Z_idx = np.arange(z0, z1)
     
-    if len(st_idx) > 1:
-        s_idx = np.where(table[Z_idx[0]+st_idx[0]:Z_idx[0]+st_idx[0]+(len(st_idx)-1)+1, 2] == s)
-    elif (len(st_idx) == 1):
-        s_idx = np.where(table[Z_idx[0]+st_idx[0], 2] == s)
-    else:
+    st0, st1 = np.searchsorted(st_col[z0:z1], [st, st+1])
+    st_idx = np.arange(st0, st1)
+    if len(st_idx) == 0:
         return(Z_idx, st_idx, [])
-    s_idx = s_idx[0]
+    
+    s0, s1 = np.searchsorted(s_col[z0+st0:z0+st1], [s, s+1])
+    s_idx = np.arange(s0, s1)
     return(Z_idx, st_idx, s_idx)
 
 
-def electrons(Z, st, s):
-    # extracting the right Z and ionisation stage indexes from the data
-    Z_idx = np.where(table[:, 0] == Z)
-    Z_idx = Z_idx[0]
-    
-    if len(Z_idx) > 1 :
-        st_idx = np.where(table[Z_idx[0]:Z_idx[len(Z_idx)-1]+1, 1] == st)
-    elif (len(Z_idx) == 1):
-        st_idx = np.where(table[Z_idx[0], 1] == st)
-        
-    st_idx = st_idx[0]  # before that, st_idx is a tuple of a single array
-    
-    element, stage, gap, il =  correspondence(Z, st, s, 0)  # turning Z, st and s into their corresponding names (for a more detailled graph)
+def build_index(tab):   # dense (Z, st, s) index of a table sorted by Z, st and s: first row and last row + 1 of each group (-1 if the group does not exist)
+    keys = key_columns(tab)
+    new = np.ones(len(keys), dtype=bool)
+    new[1:] = np.any(keys[1:] != keys[:-1], axis=1)    # first row of each (Z, st, s) group
+    first = np.flatnonzero(new)
+    last = np.append(first[1:], len(keys))
     
-    if ((len(st_idx) != 0) and (len(st_idx) != 1)) :
-        proba_global = table[Z_idx[0]+st_idx[0]:Z_idx[0]+st_idx[0]+(len(st_idx)-1), 6:16]/10000 # probability for each vacancy position
-        proba = proba_global[s-1]   # probability for a specific vacancy
-    elif (len(st_idx) == 1):
-        proba_global = table[Z_idx[0]+st_idx[0], 6:16]/10000 # probability for each vacancy position
-        proba = proba_global   # there is only one vacancy possible
-    
-
-    # Plotting the graph
-    plt.figure()
-    x= np.arange(1,11)  # number of electrons
-    plt.plot(x, proba , drawstyle = 'steps', label = element + " " + stage)
-    plt.title(gap + "-shell ionisation of " + element + " " + stage + " (Z = " + str(Z) + ")")
-    plt.legend()
-    plt.xlabel("Number of emitted electrons")
-    plt.ylabel("Probability")
-    plt.savefig('graph_' + element + '_' + stage + '_' + gap + '.png')
+    start = np.full((N_Z, N_ST, N_S), -1, dtype = np.int32)
+    stop = np.full((N_Z, N_ST, N_S), -1, dtype = np.int32)
+    Z, st, s = keys[first].T
+    start[Z, st, s] = first
+    stop[Z, st, s] = last
+    return(start, stop)
+
+
+def Z_st_s_row(Z, st, s):   # row of table2, -1 if this element, ionisation stage and initial vacancy do not exist
+    load_tables()
+    if 0 <= Z < N_Z and 0 <= st < N_ST and 0 <= s < N_S:
+        return(row_idx[Z, st, s])
+    return(-1)
+
+
+def Z_st_s_rows(Z, st, s):  # same as Z_st_s_row for arrays of Z, st and s (broadcast together)
+    load_tables()
+    Z, st, s = np.broadcast_arrays(np.asarray(Z, dtype=int), np.asarray(st, dtype=int), np.asarray(s, dtype=int))
+    inside = (Z >= 0) & (Z < N_Z) & (st >= 0) & (st < N_ST) & (s >= 0) & (s < N_S)
+    rows = np.full(Z.shape, -1)
+    rows[inside] = row_idx[Z[inside], st[inside], s[inside]]
+    return(rows)
+
+
+def electrons(Z, st, s):    # probability to emit 1-10 electrons
+    load_tables()
+    row = Z_st_s_row(Z, st, s)
+    if row < 0:
+        return([])
+    proba = auger_tab["counts"][row]/10000   # probability for this vacancy
     return(proba)
 
 
-def all_electrons(S) :  # the only variable is the intial shell vacancy. Three choices : K (1), L_1 (2) or M_1 (3)
+def electrons_batch(Z, st, s):  # electrons for arrays of Z, st and s: probabilities (N, 10), mean and variance of the number of emitted electrons, and which combinations exist
+    rows = Z_st_s_rows(Z, st, s)
+    valid = rows >= 0
     
-    electrons_nb = []
-    Z_elec = []
-    for z in range(4,30) :  # iterating for each neutral atom (Z: 4-30)
-        Z_idx = np.where(table[:, 0] == z)
-        Z_idx = Z_idx[0]
-        
-        average = 0 # average number of electrons for a specific Z and inner shell vacancy
-        proba = table[Z_idx[0] + S-1, 6:] # probability to get X electrons
-        if table[Z_idx[0] + S-1, 1] == 1 and table[Z_idx[0] + S-1, 0] == z: # to make sure the right ionisation stage exists for this atom
-            for i in range(len(proba)) :
-                average += proba[i]*(i+1)
-        Z_elec = np.append(Z_elec, average)
-    electrons_nb = np.append(electrons_nb, Z_elec)/10000    # divided by 10000
-    
-    # Plotting the graph
-    #plt.figure()
-    gap = correspondence(0, 0, S, 0)[2]    # the only relevant data is the gap type
-    x = np.arange(5,31)
-    plt.plot(x, electrons_nb , drawstyle = 'steps', label = gap + "-shell vacancy")
-    plt.title("Electrons emitted during the decay of an inner-shell vacancy")
-    plt.legend()
-    plt.xlabel("Atomic number")
-    plt.ylabel("Number of electrons")
-    plt.savefig("nb_of_electrons_" + gap + "-shell.png")
-    return(electrons_nb)
-
-    electron_nb = []
-    for z in range(5,30) :
-        Z_idx = np.where(fluo_tab[:, 0] == z)
-        Z_idx = Z_idx[0]
-        if S==1:
-            e_nb = 0
-            s_idx = np.where(fluo_tab[Z_idx[0]: Z_idx[len(Z_idx)-1]+1, 2]==S)
-            s_idx = s_idx[0]
-            if fluo_tab[Z_idx[0] + s_idx[S-1], 1] == 1 and fluo_tab[Z_idx[0] + s_idx[S-1], 0] == z and fluo_tab[Z_idx[0] + s_idx[S-1], 2] == S:
-                for i in range(len(s_idx)):
-                    e_nb += fluo_tab[Z_idx[0]+s_idx[i], 3] # number of electrons
-                electron_nb = np.append(electron_nb, e_nb)
-            
-            
-    
-    # Plotting the graph
-    #plt.figure()
-    gap = correspondence(0, 0, S, 0)[2]    # the only useful value is the gap type
-    x = np.arange(6,31)
-    plt.plot(x, electron_nb , drawstyle = 'steps', label = gap + "-shell vacancy")
-    plt.title("Electrons emitted during the decay of an inner-shell vacancy")
-    plt.legend()
-    plt.xlabel("Atomic number")
-    plt.ylabel("Number of Auger electrons")
-    #plt.savefig("nb_of_electrons_" + gap + "-shell.png")
-    return(electron_nb)
+    proba = np.full(rows.shape + (10,), np.nan)    # NaN for the combinations missing from table2
+    proba[valid] = auger_tab["counts"][rows[valid]]/10000
+    mean = np.full(rows.shape, np.nan)
+    variance = np.full(rows.shape, np.nan)
+    stats = electron_stats[tuple(key_columns(auger_tab)[rows[valid]].T)]
+    mean[valid] = stats["mean"][:, 0]
+    variance[valid] = stats["variance"][:, 0]
+    return(proba, mean, variance, valid)
 
 
+def all_electrons(S) :  # the only variable is the intial shell vacancy. Three choices : K (1), L_1 (2) or M_1 (3)
+    load_tables()
+    if not 0 <= S < N_S:
+        return(np.full(26, np.nan))    # no such vacancy (a negative S would give another one)
+    electrons_nb = electron_stats["mean"][4:30, 1, S, 0]   # neutral atoms Z = 4-29, photo-electron included
+    return(np.nan_to_num(electrons_nb)) # 0 if this ionisation stage does not exist for the atom
+
+
+def _transitions(il):   # sorted tuple of the transitions of il (an il or a sequence of il), each of them 1-22
+    il = tuple(sorted(set(np.atleast_1d(il).tolist())))
+    if not all(type(i) is int and 1 <= i < N_IL for i in il):
+        raise ValueError("the transitions il must be integers from 1 to %d, not %r" % (N_IL - 1, il))
+    return(il)
+
+
+def _member(il):    # member[il] = 1 for the transitions of il: the column of yield_cube([il]) is computed without caching it
+    load_tables()
+    member = np.zeros(N_IL)
+    member[list(_transitions(il))] = 1
+    return(member)
+
+
+def yield_cube(groups = line_groups):
+    # groups: {name: il or tuple of il} or a sequence of il/ tuples of il; returns the names and w[Z, st, g], the sum of
+    # the fluorescence yields of the transitions of the group g for each ion (NaN if the ion has none of them). The
+    # cubes are kept until the tables are reloaded (one per set of groups: for a fixed set of groups, such as line_groups)
+    load_tables()
+    items = groups.items() if isinstance(groups, dict) else [(None, il) for il in groups]
+    key = tuple((name, _transitions(il)) for name, il in items)
+    cube = _yield_cubes.get(key)
+    if cube is None:
+        member = np.zeros((N_IL, len(key)))   # member[il, g] = 1 if the transition il is in the group g
+        for g, (name, il) in enumerate(key):
+            member[list(il), g] = 1
+        w = fluo_il_w @ member  # all the ions and groups in one product
+        w[(fluo_il_n @ member) == 0] = np.nan
+        w.flags.writeable = False
+        cube = _yield_cubes[key] = ([il if name is None else name for name, il in key], w)  # the tuple of il if there is no name
+    return(cube)
+
+
+@_memoized
 def fluo_yield(Z, il):  # if il is an array, the fluorescence yields will be added into a single fluorescence yield (example : K alpha_1 + K alpha_2 to get K alpha)
-    Z_idx = np.where(fluo_tab[:, 0] == Z)
-    Z_idx = Z_idx[0]
-    w = np.empty(26)    # base array for the fluorescence yield for each ionisation stage
-    w.fill(np.NaN)
-    if type(il) == int:
-        il = [il]
-    il_name = ""  # for the graph legend
-    
-    for I in range(len(il)) :
-        il_name = " ".join([il_name, correspondence(0, 0, 0, il[I])[3]])    # for the graph legend
-        
-        if len(Z_idx) > 1 :
-            il_idx = np.where(fluo_tab[Z_idx[0]:Z_idx[len(Z_idx)-1], 4] == il[I])
-        elif (len(Z_idx) == 1):
-            il_idx = np.where(fluo_tab[Z_idx[0], 4] == il[I])    
-        il_idx = il_idx[0]
-        
-        for st in range(Z):    # iteration for each ionisation stage
-            for i in range(len(il_idx)):
-                if fluo_tab[Z_idx[0] + il_idx[i], 1] == st+1 and fluo_tab[Z_idx[0] + il_idx[i], 0] == Z:
-                    if np.isnan(w[st]) :
-                        w[st] = fluo_tab[Z_idx[0]+il_idx[i], 6]
-                    else :
-                        w[st] += fluo_tab[Z_idx[0]+il_idx[i], 6]      
-    # graph
-    #plt.figure()
-    element= correspondence(Z, 0, 0, 0)[0]
-    x = np.arange(1, 27)
-    plt.plot(x, w, drawstyle = 'steps', label = il_name)
-    plt.title("Fluorescence yield for all ions of " + element)
-    plt.legend()
-    plt.xlabel("ionisation stage")
-    plt.ylabel("fluorescence yield")
-    #plt.savefig("fluorescence_yield" + il_name + ".png")
+    member = _member(il)
+    if not 0 <= Z < N_Z:
+        return(np.full(26, np.nan))    # no such element (a negative Z would give another one)
+    w = fluo_il_w[Z, 1:27] @ member    # fluorescence yield for each ionisation stage (NaN if there is no transition of this type for this ion)
+    w[(fluo_il_n[Z, 1:27] @ member) == 0] = np.nan
     return(w)
 
 
-def energy(Z, s):
-    Z_idx = np.where(table[:, 0] == Z)
-    Z_idx = Z_idx[0]
-    
-    if len(Z_idx) > 1 :
-        s_idx = np.where(table[Z_idx[0]:Z_idx[len(Z_idx)-1]+1, 2] == s)
-    elif (len(Z_idx) == 1):
-        s_idx = np.where(table[Z_idx[0], 2] == s)
-    s_idx = s_idx[0]
-    
-    energy_I = np.empty(26) # base tables for the energies
-    energy_I.fill(np.NaN)
-    energy_E = np.empty(26)
-    energy_E.fill(np.NaN)
+@_memoized
+def energy(Z, s):   # ionisation energy, average Auger electron energy and their sum for the ionisation stages 1-26
+    load_tables()
+    if 0 <= Z < N_Z and 0 <= s < N_S:
+        rows = row_idx[Z, 1:27, s]  # rows of the ionisation stages 1-26
+    else:
+        rows = np.full(26, -1)  # no such element or vacancy (negative indexes would give another ion)
+    valid = rows >= 0
     
-    for st in range(26):
-        if len(Z_idx) > 1 :
-            st_idx = np.where(table[Z_idx[0]:Z_idx[len(Z_idx)-1]+1, 1] == st+1)
-        elif (len(Z_idx) == 1):
-            st_idx = np.where(table[Z_idx[0], 1] == st+1)
-        st_idx = st_idx[0]
-        
-        for ST in range(len(st_idx)):
-            if table[Z_idx[0]+st_idx[ST], 2] == s and table[Z_idx[0]+st_idx[ST], 0] == Z:
-                if np.isnan(energy_I[st]):
-                    energy_I[st] = table[Z_idx[0]+st_idx[ST], 3]
-                else:
-                    energy_I[st] += table[Z_idx[0]+st_idx[ST], 3]
-                if np.isnan(energy_E[st]):
-                    energy_E[st] = table[Z_idx[0]+st_idx[ST], 4]
-                else:
-                    energy_E[st] += table[Z_idx[0]+st_idx[ST], 4]
-    # graph
-    plt.figure()
-    element= correspondence(Z, 0, s, 0)[0]
-    gap = correspondence(Z, 0, s, 0)[2]
-    x = np.arange(1, 27)
-    plt.plot(x, energy_I, drawstyle = 'steps', label = "Ionisation energy")
-    plt.plot(x, energy_E, drawstyle = 'steps', label = "Average Auger electron energy")
-    #plt.plot(x, energy_E + energy_I, drawstyle = 'steps', label = "Total")
-    plt.title("Energy for " + element+" ("+gap+"-shell vacancy)")
-    plt.legend()
-    plt.xlabel("ionisation stage")
-    plt.ylabel("energy (eV)")
-    #plt.savefig("energy_"+element+"_"+gap+"-shell.png")
+    energy_I = np.full(26, np.nan) # base tables for the energies
+    energy_E = np.full(26, np.nan)
+    energy_I[valid] = table[rows[valid], 3]   # energies of table2 (not rounded to the precision of auger_tab)
+    energy_E[valid] = table[rows[valid], 4]
     return(energy_I, energy_E, energy_I + energy_E)
 
 
-def energy_st(Z, s):
-    Z_idx = np.where(table[:, 0] == Z)
-    Z_idx = Z_idx[0]
+@_memoized
+def energy_st(Z, s):    # average number of electrons and Auger electron energy of each ionisation stage, sorted by number of electrons
+    load_tables()
+    if not (0 <= Z < N_Z and 0 <= s < N_S):
+        return(np.empty(0), np.empty(0))    # no such element or vacancy, as for an element missing from table2
+    rows = row_idx[Z, :, s]
+    rows = rows[rows >= 0]  # all ionisation stages with this initial vacancy
     
-    if len(Z_idx) > 1 :
-        s_idx = np.where(table[Z_idx[0]:Z_idx[len(Z_idx)-1]+1, 2] == s)
-    elif (len(Z_idx) == 1):
-        s_idx = np.where(table[Z_idx[0], 2] == s)
-    s_idx = s_idx[0]
-        
-    energy = np.zeros(len(s_idx))
-    e_nb = np.zeros(len(s_idx)) # average number of electrons for a given Z and initial vacancy
-    
-    for c in range(len(s_idx)):
-        if table[Z_idx[0] + s_idx[c], 2] == s and table[Z_idx[0] + s_idx[c], 0] == Z:
-            proba = table[Z_idx[0]+s_idx[c], 6:]/10000
-            energy[c] += table[Z_idx[0]+s_idx[c], 4]
-            for i in range(len(proba)) :
-                e_nb[c] += proba[i]*(i+1)
+    energy = table[rows, 4]
+    e_nb = electron_stats["mean"][Z, auger_tab["st"][rows], s, 0]   # average number of electrons for a given Z and initial vacancy
     
     # we need to sort the energy in ascending order
-    zipped_lists = zip(e_nb, energy)
-    sorted_pairs = sorted(zipped_lists)
-    tuples = zip(*sorted_pairs)
-    e_nb, energy =  [list(tuple) for tuple in tuples]
-    
-    # graph
-    ionisation = np.zeros(len(s_idx))
-    
-    plt.figure()
-    element= correspondence(Z, 0, s, 0)[0]
-    gap = correspondence(Z, 0, s, 0)[2]
-    
-    plt.plot(e_nb, energy, drawstyle = 'steps', label = gap+" shell vacancy")
-    plt.title("Energy for " + element)
-    plt.legend()
-    plt.xlabel("number of electrons")
-    plt.ylabel("energy (eV)")
-    #plt.savefig("energy_per_electron_"+element+"_"+gap+"-shell.png")
+    order = np.lexsort((energy, e_nb))
+    e_nb, energy = e_nb[order], energy[order]
     return(e_nb, energy)
 
 
 def all_fluo_yield(st, il):  # if il is an array, the fluorescence yields will be added into a single fluorescence yield (example : K alpha_1 + K alpha_2 to get K alpha)
-    w = np.empty(30)    # base array for the fluorescence yield of a given element
-    w.fill(np.NaN)
-    for Z in range(5, 31):
-        Z_idx = np.where(fluo_tab[:, 0] == Z)
-        Z_idx = Z_idx[0]
-        
-        if type(il) == int:
-            il = [il]
-        il_name = ""  # for the graph legend
-        
-        for I in range(len(il)) :
-            il_name = " ".join([il_name, correspondence(0, 0, 0, il[I])[3]])    # for the graph legend
-            
-            if len(Z_idx) > 1 :
-                il_idx = np.where(fluo_tab[Z_idx[0]:Z_idx[len(Z_idx)-1], 4] == il[I])
-            elif (len(Z_idx) == 1):
-                il_idx = np.where(fluo_tab[Z_idx[0], 4] == il[I])    
-            il_idx = il_idx[0]
-            for i in range(len(il_idx)):
-                if fluo_tab[Z_idx[0] + il_idx[i], 1] == st and fluo_tab[Z_idx[0] + il_idx[i], 0] == Z:
-                    if np.isnan(w[Z-1]) :
-                        w[Z-1] = fluo_tab[Z_idx[0]+il_idx[i], 6]
-                    else :
-                        w[Z-1] += fluo_tab[Z_idx[0]+il_idx[i], 6]  
-    #graph
-    #plt.figure()
-    x = np.arange(1, 31)
-    plt.plot(x, w, drawstyle = 'steps', label = il_name)
-    plt.title("Fluorescence yield for all neutral atoms (Z=5-30)")
-    plt.legend()
-    plt.xlabel("atomic number")
-    plt.ylabel("fluorescence yield")
-    #plt.savefig("fluorescence_yield" + il_name + ".png")
+    w = np.full(30, np.nan)    # base array for the fluorescence yield of a given element
+    member = _member(il)
+    if 0 <= st < N_ST:  # NaN for a stage that does not exist (a negative st would give another one)
+        w[4:] = fluo_il_w[5:31, st] @ member
+        w[4:][(fluo_il_n[5:31, st] @ member) == 0] = np.nan
     return(w)
 
 
+@_memoized
 def avg_photon(Z, st, s):
-    if Z>4:
-        Z_idx, st_idx, s_idx = Z_st_s_idx(fluo_tab, Z, st, s)
-    Z_idx2, st_idx2, s_idx2 = Z_st_s_idx(table, Z, st, s)
-    avg_N = 0
-    avg_E = 0
-    
-    # Calculating the average number of Auger electron emitted N_e
-    if len(s_idx2) > 1:
-        proba = table[Z_idx2[0]+st_idx2[0]+s_idx2[0]:Z_idx2[len(s_idx2)-1]+1, 6:]/10000
-        E_e = table[Z_idx2[0]+st_idx2[0]+s_idx2[0]:Z_idx2[len(s_idx2)-1]+1, 4]
-    elif len(s_idx2) == 1:
-        proba = table[Z_idx2[0]+st_idx2[0]+s_idx2[0], 6:]/10000
-        E_e = table[Z_idx2[0]+st_idx2[0]+s_idx2[0], 4]
-    else:
+    load_tables()
+    row = Z_st_s_row(Z, st, s)
+    if row < 0:
         return([])
     
-    N_e = 0
-    for n in range(len(proba)):
-        N_e += proba[n]*n    # n instead of n+1 to remove the photo-electron (1-10 electrons -> 0-9 Auger electrons)
+    # Calculating the average number of Auger electron emitted N_e
+    proba = auger_tab["counts"][row]/10000
+    E_e = float(table[row, 4])
+    N_e = electron_stats["mean"][Z, st, s, 1]  # without the photo-electron (1-10 electrons -> 0-9 Auger electrons)
     if Z<5:
         return(Z, st, s, N_e, E_e, 0, 0)
     
+    groups = fluo_group_idx[Z, st, s, :len(proba)]  # one group of transitions for each delta
+    present = groups >= 0
+    if not present.any():
+        return(Z, st, s, N_e, E_e, 0, 0)    # we can stop now because there is no fluorescent yield in that situation
+    
     # Calculating the average photon number avg_N and the average photon energy avg_E
-    MAX = int(max(fluo_tab[:, 3]))
-    for delta in range(MAX+1):
-        if len(s_idx) > 1:
-            D_idx = np.where(fluo_tab[Z_idx[0]+st_idx[0]+s_idx[0]:Z_idx[0]+st_idx[0]+s_idx[len(s_idx)-1]+1, 3] == delta)
-        elif len(s_idx) == 1:
-            D_idx = np.where(fluo_tab[Z_idx[0]+st_idx[0]+s_idx[0], 3] == delta)
-        elif len(s_idx2)!=0:
-            return(Z, st, s, N_e, E_e, 0, 0)    # we can stop now because there is no fluorescent yield in that situation
-        else:
-            return([])
-        
-        D_idx = D_idx[0]
-        if len(D_idx)>1:
-            w = fluo_tab[Z_idx[0]+st_idx[0]+s_idx[0]+D_idx[0]:Z_idx[0]+st_idx[0]+s_idx[0]+D_idx[0]+len(D_idx),6]
-            E_p_all = fluo_tab[Z_idx[0]+st_idx[0]+s_idx[0]+D_idx[0]:Z_idx[0]+st_idx[0]+s_idx[0]+D_idx[0]+len(D_idx),5]
-        elif len(D_idx)==1:
-            w = fluo_tab[Z_idx[0]+st_idx[0]+s_idx[0]+D_idx[0], 6]
-            E_p_all = fluo_tab[Z_idx[0]+st_idx[0]+s_idx[0]+D_idx[0], 5]
-        else:
-            w = []
-            E_p_all = []
-        
-        N_p = np.zeros(MAX+1)     # number of emitted photons
-        E_p = np.zeros(MAX+1)
-        if type(w)==np.float64:
-            N_p[delta] += w
-            E_p[delta] += E_p_all*w
-        else:
-            for il in range(len(w)):
-                N_p[delta] += w[il]
-                E_p[delta] += E_p_all[il]*w[il]
-        avg_N+=proba[delta]*N_p[delta]
-        avg_E+=proba[delta]*E_p[delta]
+    N_p = np.where(present, fluo_w_sum[groups], 0)    # number of emitted photons for each delta
+    E_p = np.where(present, fluo_wE_sum[groups], 0)
+    avg_N = proba @ N_p
+    avg_E = proba @ E_p
     return(Z, st, s, N_e, E_e, avg_N, avg_E)
 
 
+avg_photon_fmt = ["%2d", "%2d", "%d", "%.10g", "%.10g", "%.10g", "%.10g"]   # columns of the table written by avg_photon_table
+
+
+def avg_photon_table(filename = "avg_photons_electrons2", rows = None):  # same results as avg_photon, for all rows of table2 in one pass (written next to the other tables)
+    # rows: only these rows of table2 are computed (in this order)
+    load_tables()
+    rows = np.arange(len(auger_tab)) if rows is None else np.asarray(rows, dtype = np.intp)
+    proba = auger_tab["counts"][rows]/10000
+    n_delta = proba.shape[1]
+    
+    # sums of the fluorescence yields (and yields x photon energy) of each group of table3, for each row of table2 and each delta
+    position = np.full(len(auger_tab), -1, dtype = np.intp)    # row of table2 -> row of the result
+    position[rows] = np.arange(len(rows))
+    groups_rows = row_idx[fluo_groups[:, 0], fluo_groups[:, 1], fluo_groups[:, 2]]
+    groups_rows = np.where(groups_rows >= 0, position[groups_rows], -1)
+    valid = groups_rows >= 0   # some transitions of table3 have no corresponding row in table2 (or are not computed)
+    bins = groups_rows[valid]*n_delta + fluo_groups[valid, 3]
+    N_p = np.bincount(bins, weights=fluo_w_sum[valid], minlength=len(rows)*n_delta).reshape(len(rows), n_delta)
+    E_p = np.bincount(bins, weights=fluo_wE_sum[valid], minlength=len(rows)*n_delta).reshape(len(rows), n_delta)
+    
+    keys = key_columns(auger_tab)[rows]
+    energy_tab = np.empty((len(rows), 7))
+    energy_tab[:, :3] = keys
+    energy_tab[:, 3] = electron_stats["mean"][tuple(keys.T)][:, 1]   # mean number of Auger electrons (without the photo-electron)
+    energy_tab[:, 4] = table[rows, 4]   # Auger electron energy of table2
+    energy_tab[:, 5] = np.einsum("ij,ij->i", proba, N_p)    # mean number of photons
+    energy_tab[:, 6] = np.einsum("ij,ij->i", proba, E_p)    # mean photon energy
+    
+    if filename is not None:
+        path = os.path.join(data_dir, filename)
+        tmp = path + ".%d.tmp" % os.getpid()   # renamed once complete, so that the table is never read half-written
+        np.savetxt(tmp, energy_tab, fmt = avg_photon_fmt)
+        os.replace(tmp, path)
+    return(energy_tab)
+
+
+
+if os.environ.get("INNER_SHELL_PROFILE", "") not in ("", "0"):  # opt-in instrumentation of the functions (instrument.py)
+    import instrument
+    instrument.enable_from_environment(__name__)
+
+
 
 """
 Applications of the functions
@@ -386,31 +571,14 @@ Applications of the functions
 
 #electrons(26, 1, 1)   # Fe I with K-shell vacancy
 
-# graphs for the K, L_1 and M_1 shell vacancies:
+# mean number of electrons for the K, L_1 and M_1 shell vacancies:
 #all_electrons(1), all_electrons(2), all_electrons(5)
 
 # K alpha and K beta fluorescence for all ions of iron:
 #fluo_yield(26, (1, 2)), fluo_yield(26, (3, 4))
 
-
-# All fluorescence yields of neutral elements:
-"""
-st = 1
-# K-shell
-plt.figure()
-for il in range(1, 8, 2):
-    all_fluo_yield(st, (il, il+1))
-
-# L-shell
-plt.figure()
-for il in range(9, 13,):
-    all_fluo_yield(st, il)
-all_fluo_yield(st, (13,14)), all_fluo_yield(st, 15)
-
-# M-shell
-plt.figure()
-all_fluo_yield(st, (16,17)), all_fluo_yield(st, 18), all_fluo_yield(st, 19), all_fluo_yield(st, (20,21)), all_fluo_yield(st, 22)
-"""
+# K alpha, K beta, L and M fluorescence of all ions (w[Z, st, g]):
+#names, w = yield_cube()
 
 # Oxygen ions energy:
 #energy(8, 1)
@@ -430,12 +598,10 @@ Q = np.reshape(oxygen_tab, (4, 7))
 """
 
 
-"""
-energy_tab = []
-for Z in range(4, 31):
-    for st in range(1, 28):
-        for s in range(1, 8):
-            #print(Z, st, s)
-            energy_tab = np.append(energy_tab, avg_photon(Z, st, s))
-energy_tab = np.reshape(energy_tab, (1090, 7))
-"""
\ No newline at end of file
+# Memoized results: a smaller cache, and its hits and misses
+#set_cache_size(256)
+#fluo_yield(26, (1, 2)), fluo_yield(26, [1, 2])   # same entry (the second call is a hit)
+#cache_info()["fluo_yield"]
+
+# Table with the mean number and energy of the emitted electrons and photons for all ions (used by avg_photon.py):
+#avg_photon_table("avg_photons_electrons2")
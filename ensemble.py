@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sensitivity of the table of avg_photon_table (N_e, E_e, N_p, E_p) to the atomic data, for ensembles of perturbed tables
+
+Each member k of the ensemble multiplies the fluorescence yields of table3 by yield_factors[k] (one factor per row
+of table3) and the probabilities of table2 by proba_factors[k] (one factor per row and number of electrons). The
+derived tables of all the members are computed together: the sums of the yields (and yield x energy) of each
+(row of table2, delta) group are one sparse matrix product for a whole chunk of members, so the memory only
+depends on the size of the chunks.
+
+Recap of all functions:
+
+lognormal_factors(K, shape, sigma, seed): K random factors of median 1 (relative uncertainty sigma)
+ensemble_tables(yield_factors, proba_factors, normalize, chunk): avg_photon_table of every member, shape (K, rows of table2, 7)
+percentile_bands(tables, q): percentiles over the members of each column of each row, shape (len(q), rows of table2, 7)
+ensemble(yield_factors, proba_factors, q, normalize, chunk): ensemble_tables and percentile_bands
+"""
+
+import numpy as np
+from scipy import sparse
+import emitted_electrons as ee
+
+_groups = None
+
+
+@ee.on_reload
+def _clear():   # the tables were reloaded (set_precision, shared_tables.attach)
+    global _groups
+    _groups = None
+
+
+def lognormal_factors(K, shape, sigma = 0.1, seed = None):
+    rng = np.random.default_rng(seed)
+    return(np.exp(rng.normal(0, sigma, (K,) + tuple(np.atleast_1d(shape)))))
+
+
+def _group_matrices():
+    # sparse matrices (rows of table2 x 10 deltas, rows of table3) of the yields and of yield x energy: the sums of
+    # each group for a member are these matrices times its yield factors
+    global _groups
+    if _groups is not None:
+        return(_groups)
+    ee.load_tables()
+    # the yields of the compact table fluo_lines and the energies fluo_E (as for avg_photon_table), whose line i is the row
+    # file_row[i] of table3 (the factors are given in the order of the file)
+    file_row = np.lexsort(ee.fluo_tab[:, 4::-1].T)
+    keys = ee.key_columns(ee.fluo_lines, 4)
+    rows = ee.row_idx[keys[:, 0], keys[:, 1], keys[:, 2]]
+    valid = np.flatnonzero(rows >= 0)   # some transitions of table3 have no corresponding row in table2
+    group = rows[valid]*ee.N_DELTA + keys[valid, 3]
+    shape = (len(ee.auger_tab)*ee.N_DELTA, len(ee.fluo_tab))
+    w = ee.fluo_lines["w"][valid].astype(float)
+    W = sparse.csr_matrix((w, (group, file_row[valid])), shape = shape)
+    WE = sparse.csr_matrix((w*ee.fluo_E[valid], (group, file_row[valid])), shape = shape)
+    _groups = (W, WE)
+    return(_groups)
+
+
+def ensemble_tables(yield_factors = None, proba_factors = None, normalize = False, chunk = 100):
+    # yield_factors: (K, rows of table3) and/ or proba_factors: (K, rows of table2, 10), None for no perturbation (both
+    # can be np.memmap; without any of them, K = 1: the table of avg_photon_table); normalize: the perturbed
+    # probabilities of each row keep the sum of table2
+    ee.load_tables()
+    W, WE = _group_matrices()
+    proba = ee.auger_tab["counts"]/10000
+    n_rows = len(proba)
+    K = len(yield_factors) if yield_factors is not None else len(proba_factors) if proba_factors is not None else 1
+    
+    tables = np.empty((K, n_rows, 7))
+    tables[:, :, :3] = ee.key_columns(ee.auger_tab)
+    tables[:, :, 4] = ee.table[:, 4]
+    for start in range(0, K, chunk):
+        stop = min(start + chunk, K)
+        if proba_factors is None:
+            p = np.broadcast_to(proba, (stop - start, n_rows, ee.N_DELTA))
+        else:
+            p = proba*np.asarray(proba_factors[start:stop], dtype = float)
+            if normalize:
+                with np.errstate(invalid = "ignore"):
+                    p = p*np.nan_to_num(proba.sum(axis=1)/p.sum(axis=2))[:, :, None]
+        if yield_factors is None:
+            f = np.ones((len(ee.fluo_tab), 1))
+        else:
+            f = np.asarray(yield_factors[start:stop], dtype = float).T
+        N_p = (W @ f).T.reshape(-1, n_rows, ee.N_DELTA)  # sums of each group for every member of the chunk
+        E_p = (WE @ f).T.reshape(-1, n_rows, ee.N_DELTA)
+        
+        tables[start:stop, :, 3] = p @ np.arange(ee.N_DELTA)  # mean number of Auger electrons (without the photo-electron)
+        tables[start:stop, :, 5] = np.einsum("krd,krd->kr", p, N_p)
+        tables[start:stop, :, 6] = np.einsum("krd,krd->kr", p, E_p)
+    return(tables)
+
+
+def percentile_bands(tables, q = (5, 50, 95)):
+    return(np.percentile(tables, q, axis=0))
+
+
+def ensemble(yield_factors = None, proba_factors = None, q = (5, 50, 95), normalize = False, chunk = 100):
+    return(percentile_bands(ensemble_tables(yield_factors, proba_factors, normalize, chunk), q))
+
+
+
+"""
+Applications of the functions
+"""
+
+# 5th, 50th and 95th percentiles of N_e, E_e, N_p and E_p with 10 % uncertainties on the yields and the probabilities:
+#K = 1000
+#yield_factors = lognormal_factors(K, len(ee.fluo_tab), 0.1, seed = 1)
+#proba_factors = lognormal_factors(K, (len(ee.auger_tab), 10), 0.1, seed = 2)
+#low, median, high = ensemble(yield_factors, proba_factors, normalize = True)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Graphs of the functions of emitted_electrons.py and avg_photon.py
+
+Every function draws on the matplotlib Axes it is given (nothing is drawn on the global pyplot figure, so
+the graphs can be made in threads or with the Agg backend) and returns the same values as the function it plots.
+
+Recap of all functions:
+
+il_label(il): legend of one fluorescence transition or of a tuple of transitions (K alpha_1 + K alpha_2 -> " $K\\alpha_1$ $K\\alpha_2$")
+
+plot_electrons(ax, Z, st, s): number distribution of emitted electrons (emitted_electrons.electrons)
+plot_all_electrons(ax, S): mean number of emitted electrons for all neutral atoms (emitted_electrons.all_electrons)
+plot_fluo_yield(ax, Z, il): fluorescence yield for all ions of an element (emitted_electrons.fluo_yield)
+plot_energy(ax, Z, s): ionisation and Auger electron energy for all ions of an element (emitted_electrons.energy)
+plot_energy_st(ax, Z, s): energy per number of electrons (emitted_electrons.energy_st)
+plot_all_fluo_yield(ax, st, il): fluorescence yield for all neutral atoms (emitted_electrons.all_fluo_yield)
+
+plot_avg_energy_st(ax, Z, s): number and energy of electrons and photons for each ionisation stage (avg_photon.energy_st)
+plot_avg_energy_Z(ax, s): mean energy of electrons and photons for all neutral atoms (avg_photon.energy_Z)
+plot_avg_number_Z(ax, s): mean number of electrons and photons for all neutral atoms (avg_photon.energy_Z)
+"""
+
+import numpy as np
+import emitted_electrons as ee
+import avg_photon as ap
+
+
+def il_label(il):
+    il = np.atleast_1d(il).tolist()    # an il (int or NumPy integer) or a sequence of il
+    il_name = ""
+    for I in range(len(il)):
+        il_name = " ".join([il_name, ee.correspondence(0, 0, 0, il[I])[3]])
+    return(il_name)
+
+
+def plot_electrons(ax, Z, st, s):
+    proba = ee.electrons(Z, st, s)
+    if len(proba) == 0:
+        return(proba)
+    element, stage, gap, il = ee.correspondence(Z, st, s, 0)
+    x = np.arange(1, 11)  # number of electrons
+    ax.plot(x, proba, drawstyle = 'steps', label = element + " " + stage)
+    ax.set_title(gap + "-shell ionisation of " + element + " " + stage + " (Z = " + str(Z) + ")")
+    ax.legend()
+    ax.set_xlabel("Number of emitted electrons")
+    ax.set_ylabel("Probability")
+    return(proba)
+
+
+def plot_all_electrons(ax, S):
+    electrons_nb = ee.all_electrons(S)
+    gap = ee.correspondence(0, 0, S, 0)[2]    # the only relevant data is the gap type
+    x = np.arange(4, 30)  # neutral atoms Z = 4-29, as in all_electrons
+    ax.plot(x, electrons_nb, drawstyle = 'steps', label = gap + "-shell vacancy")
+    ax.set_title("Electrons emitted during the decay of an inner-shell vacancy")
+    ax.legend()
+    ax.set_xlabel("Atomic number")
+    ax.set_ylabel("Number of electrons")
+    return(electrons_nb)
+
+
+def plot_fluo_yield(ax, Z, il):
+    w = ee.fluo_yield(Z, il)
+    element = ee.correspondence(Z, 0, 0, 0)[0]
+    x = np.arange(1, 27)
+    ax.plot(x, w, drawstyle = 'steps', label = il_label(il))
+    ax.set_title("Fluorescence yield for all ions of " + element)
+    ax.legend()
+    ax.set_xlabel("ionisation stage")
+    ax.set_ylabel("fluorescence yield")
+    return(w)
+
+
+def plot_energy(ax, Z, s):
+    energy_I, energy_E, energy_tot = ee.energy(Z, s)
+    element, stage, gap, il = ee.correspondence(Z, 0, s, 0)
+    x = np.arange(1, 27)
+    ax.plot(x, energy_I, drawstyle = 'steps', label = "Ionisation energy")
+    ax.plot(x, energy_E, drawstyle = 'steps', label = "Average Auger electron energy")
+    ax.set_title("Energy for " + element + " (" + gap + "-shell vacancy)")
+    ax.legend()
+    ax.set_xlabel("ionisation stage")
+    ax.set_ylabel("energy (eV)")
+    return(energy_I, energy_E, energy_tot)
+
+
+def plot_energy_st(ax, Z, s):
+    e_nb, energy = ee.energy_st(Z, s)
+    element, stage, gap, il = ee.correspondence(Z, 0, s, 0)
+    ax.plot(e_nb, energy, drawstyle = 'steps', label = gap + " shell vacancy")
+    ax.set_title("Energy for " + element)
+    ax.legend()
+    ax.set_xlabel("number of electrons")
+    ax.set_ylabel("energy (eV)")
+    return(e_nb, energy)
+
+
+def plot_all_fluo_yield(ax, st, il):
+    w = ee.all_fluo_yield(st, il)
+    x = np.arange(1, 31)
+    ax.plot(x, w, drawstyle = 'steps', label = il_label(il))
+    ax.set_title("Fluorescence yield for all neutral atoms (Z=5-30)")
+    ax.legend()
+    ax.set_xlabel("atomic number")
+    ax.set_ylabel("fluorescence yield")
+    return(w)
+
+
+def plot_avg_energy_st(ax, Z, s, multiplicator = 1):  # multiplicator for the photon energy if needed (because it is much lower than the electron energy)
+    N_e, E_e, N_p, E_p = ap.emission_st(Z, s)
+    st_tab = np.arange(1, 27)
+    ax2 = ax.twinx()
+    ax.plot(st_tab, E_e, drawstyle = 'steps', color = 'tab:blue', label = "electrons energy")
+    ax.plot(st_tab, E_p*multiplicator, '--', drawstyle = 'steps', color = 'tab:blue', label = "photons energy (x" + str(multiplicator) + ")")
+    ax2.plot(st_tab, N_e, drawstyle = "steps", color = 'tab:orange', label = "number of Auger electrons")
+    ax2.plot(st_tab, N_p, '--', drawstyle = "steps", color = 'tab:orange', label = "number of photons")
+    ax.set_ylabel('Energy (eV)', color = 'tab:blue')
+    ax2.set_ylabel("number of photons/ electrons", color = 'tab:orange')
+    ax.set_title("Z=" + str(Z) + " and s=" + str(s))
+    ax.set_xlabel("Ionisation stage")
+    ax.legend(loc = "lower right")
+    ax2.legend()
+    return(N_e, E_e, E_p)
+
+
+def plot_avg_energy_Z(ax, s, multiplicator = 1):
+    N_e, E_e, N_p, E_p = ap.emission_Z(s)
+    gap = ee.correspondence(0, 0, s, 0)[2]
+    Z_tab = np.arange(4, 31)
+    ax.plot(Z_tab, E_e, drawstyle = 'steps', color = "tab:orange", label = "electrons")
+    ax.plot(Z_tab, E_p*multiplicator, '--', drawstyle = 'steps', color = 'tab:orange', label = "photons")
+    ax.set_title("Neutral atoms with a " + gap + "-shell gap")
+    ax.legend()
+    ax.set_ylabel("Mean energy (eV)")
+    ax.set_xlabel("Atomic number")
+    return(N_e, E_e, E_p)
+
+
+def plot_avg_number_Z(ax, s):
+    N_e, E_e, N_p, E_p = ap.emission_Z(s)
+    gap = ee.correspondence(0, 0, s, 0)[2]
+    Z_tab = np.arange(4, 31)
+    ax.plot(Z_tab, N_e, drawstyle = 'steps', color = "tab:blue", label = "electrons")
+    ax.plot(Z_tab, N_p, '--', drawstyle = 'steps', color = 'tab:blue', label = "photons")
+    ax.set_title("Neutral atoms with a " + gap + "-shell gap")
+    ax.legend()
+    ax.set_ylabel("Number of electrons/ photons")
+    ax.set_xlabel("Atomic number")
+    return(N_e, N_p)
+
+
+
+"""
+Applications of the functions
+"""
+
+"""
+import matplotlib.pylab as plt
+
+# Fe I with K-shell vacancy
+fig, ax = plt.subplots()
+plot_electrons(ax, 26, 1, 1)
+fig.savefig("graph_Fe_I_$K$.png")
+
+# graphs for the K, L_1 and M_1 shell vacancies (on the same graph):
+fig, ax = plt.subplots()
+plot_all_electrons(ax, 1), plot_all_electrons(ax, 2), plot_all_electrons(ax, 5)
+
+# K alpha and K beta fluorescence for all ions of iron:
+fig, ax = plt.subplots()
+plot_fluo_yield(ax, 26, (1, 2)), plot_fluo_yield(ax, 26, (3, 4))
+
+# All fluorescence yields of neutral elements:
+st = 1
+# K-shell
+fig, ax = plt.subplots()
+for il in range(1, 8, 2):
+    plot_all_fluo_yield(ax, st, (il, il+1))
+
+# L-shell
+fig, ax = plt.subplots()
+for il in range(9, 13,):
+    plot_all_fluo_yield(ax, st, il)
+plot_all_fluo_yield(ax, st, (13,14)), plot_all_fluo_yield(ax, st, 15)
+
+# M-shell
+fig, ax = plt.subplots()
+plot_all_fluo_yield(ax, st, (16,17)), plot_all_fluo_yield(ax, st, 18), plot_all_fluo_yield(ax, st, 19), plot_all_fluo_yield(ax, st, (20,21)), plot_all_fluo_yield(ax, st, 22)
+
+# mean energy and number of electrons and photons for all inner shells
+for I in range(1, 8):
+    fig, ax = plt.subplots()
+    plot_avg_energy_Z(ax, I)
+    fig.savefig("mean_energy_" + ee.correspondence(0, 0, I, 0)[2] + "-shell.png")
+    fig, ax = plt.subplots()
+    plot_avg_number_Z(ax, I)
+    fig.savefig("mean_number_" + ee.correspondence(0, 0, I, 0)[2] + "-shell.png")
+"""
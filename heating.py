@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Energy deposited by the Auger electrons and the fluorescence photons (heating rates) on large simulation grids
+
+Each vacancy of the shell s of the ion (Z, st) gives on average the Auger electron energy E_e (table2) and the photon
+energy E_p (avg_photon). The energy of each cell is the sum over the ions of abundance x ion fraction x vacancy rate
+x mean energy, computed with np.einsum over chunks of cells so that the inputs can be memory-mapped arrays larger
+than the memory.
+
+Recap of all functions:
+
+energy_cubes(): mean Auger electron energy and photon energy per vacancy for each (Z, st, s), shape (2, 31, 31, 8)
+heating(ions, rates, abundances, chunk, out): electron and photon energy (eV per second) of each cell (chunks of chunk_bytes by default)
+"""
+
+import numpy as np
+import emitted_electrons as ee
+
+chunk_bytes = 64*2**20  # size of the float64 copy of each chunk of ion fractions (chunk = None)
+_cubes = None
+
+
+@ee.on_reload
+def _clear():   # the tables were reloaded (set_precision, shared_tables.attach)
+    global _cubes
+    _cubes = None
+
+
+def energy_cubes():    # 0 for the combinations missing from table2
+    global _cubes
+    if _cubes is not None:
+        return(_cubes)
+    energy_tab = ee.avg_photon_table(None)
+    Z, st, s = energy_tab[:, :3].astype(int).T
+    _cubes = np.zeros((2, ee.N_Z, ee.N_ST, ee.N_S))
+    _cubes[0, Z, st, s] = energy_tab[:, 4]
+    _cubes[1, Z, st, s] = energy_tab[:, 6]
+    return(_cubes)
+
+
+def heating(ions, rates, abundances = None, chunk = None, out = None):
+    # ions[c, Z, st]: ion fractions of each cell, shape (cells, 31, 31) (can be a np.memmap)
+    # rates[s-1] or rates[c, s-1]: vacancies per second and per ion in the shell s (rates[c] can be a np.memmap too)
+    # abundances[Z]: abundance of each element (1 if not given)
+    # chunk: cells read at once (by default as many as fit in chunk_bytes)
+    # returns out[c, 0] (electrons) and out[c, 1] (photons) in eV per second
+    cubes = energy_cubes()[..., 1:]  # shells 1-7
+    if abundances is not None:
+        cubes = cubes*np.asarray(abundances, dtype = float)[None, :, None, None]
+    rates = np.asanyarray(rates)   # memory-mapped arrays stay on the disk
+    cells = len(ions)
+    if chunk is None:
+        chunk = max(1, chunk_bytes//(8*int(np.prod(np.shape(ions)[1:]))))   # 8659 cells of (31, 31) ions
+    if out is None:
+        out = np.empty((cells, 2))
+    
+    for start in range(0, cells, chunk):
+        stop = min(start + chunk, cells)
+        x = np.asarray(ions[start:stop], dtype = float)    # only this chunk is read from the disk
+        r = np.asarray(rates[start:stop] if rates.ndim == 2 else rates, dtype = float)
+        if r.ndim == 1:
+            out[start:stop] = np.einsum("czt,ezts,s->ce", x, cubes, r, optimize = True)
+        else:
+            out[start:stop] = np.einsum("czt,ezts,cs->ce", x, cubes, r, optimize = True)
+    return(out)
+
+
+
+"""
+Applications of the functions
+"""
+
+# Heating of a grid of 10^7 cells stored on the disk:
+#ions = np.lib.format.open_memmap("ions.npy", mode = "r")    # shape (10**7, 31, 31)
+#rates = np.lib.format.open_memmap("rates.npy", mode = "r")  # shape (10**7, 7)
+#electrons, photons = heating(ions, rates).T
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Opt-in instrumentation of the public functions of emitted_electrons and avg_photon
+
+When it is enabled (environment variable INNER_SHELL_PROFILE=1 before the modules are imported, enable(), or the
+context manager profiling()), the public functions of the modules are replaced by wrappers recording for each of
+them the number of calls, the total and own (without the instrumented functions it calls) time, the latency
+percentiles, the number of table rows read and the callers. disable() puts the original functions back, so
+there is no overhead at all when the instrumentation is not used.
+
+The rows read are the rows of table2/ table3 used by the call (the rows of the element for Z_st_s_idx, the row of
+table2 and the transitions of table3 for avg_photon, ...) or, for the other functions, the number of rows of
+the result.
+
+Usage:
+INNER_SHELL_PROFILE=1 INNER_SHELL_PROFILE_OUTPUT=profile.json python script.py     # report written at exit (.json, or a pstats dump otherwise)
+with profiling():
+    ...
+report(), export_json("profile.json"), export_pstats("profile.prof")    # python -m pstats profile.prof, snakeviz, ...
+
+Recap of all functions:
+
+enable(modules): instruments the public functions of the modules (emitted_electrons and avg_photon by default)
+disable(): restores the original functions
+profiling(modules): context manager enabling the instrumentation (and clearing the previous records)
+reset(): clears the records
+report(): calls, times (s), latency percentiles (s) and rows read of each function
+export_json(path): report() as a JSON file
+export_pstats(path): the records as a file readable by pstats (same format as cProfile)
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import atexit
+import inspect
+import marshal
+import threading
+import functools
+import contextlib
+import numpy as np
+
+env_var = "INNER_SHELL_PROFILE"
+output_var = "INNER_SHELL_PROFILE_OUTPUT"
+max_samples = 100000    # latencies kept for the percentiles of each function (random sample of the calls)
+percentiles = (50, 90, 99)
+
+_stats = {} # key (file, line, name) -> record of the function
+_originals = {}  # (module, attribute) -> original function
+_exit_report = False
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def _result_rows(result):
+    if isinstance(result, np.ndarray):
+        return(len(result) if result.ndim else 1)
+    if isinstance(result, (tuple, list)):
+        return(max([_result_rows(r) for r in result], default = 0))
+    return(0 if result is None else 1)
+
+
+def _avg_photon_rows(args, result):   # the row of table2 and the transitions of table3 of this ion and vacancy
+    if len(result) == 0:
+        return(0)
+    ee = sys.modules["emitted_electrons"]
+    Z, st, s = args
+    return(1 + max(int(ee.fluo_stop[Z, st, s] - ee.fluo_start[Z, st, s]), 0))
+
+
+_rows = {   # rows read by a call, from its arguments and result
+    "emitted_electrons.Z_st_s_idx": lambda args, result: len(result[0]),
+    "emitted_electrons.avg_photon": _avg_photon_rows,
+    "emitted_electrons.avg_photon_table": lambda args, result: len(result) + len(sys.modules["emitted_electrons"].fluo_lines),
+}
+
+
+def _record(key, name, elapsed, own, caller, rows):
+    with _lock:
+        s = _stats.get(key)
+        if s is None:
+            s = _stats[key] = {"name": name, "calls": 0, "total": 0., "own": 0., "max": 0., "rows": 0, "samples": [], "callers": {}}
+        s["calls"] += 1
+        s["total"] += elapsed
+        s["max"] = max(s["max"], elapsed)
+        s["own"] += own
+        s["rows"] += rows
+        if len(s["samples"]) < max_samples:
+            s["samples"].append(elapsed)
+        else:
+            i = random.randrange(s["calls"])    # reservoir sampling
+            if i < max_samples:
+                s["samples"][i] = elapsed
+        if caller is not None:
+            c = s["callers"].setdefault(caller, [0, 0., 0.])
+            c[0] += 1
+            c[1] += own
+            c[2] += elapsed
+
+
+def _wrap(func, name):
+    code = inspect.unwrap(func).__code__  # the definition of the function, not of a decorator (_memoized)
+    key = (code.co_filename, code.co_firstlineno, func.__name__)
+    rows = _rows.get(name, lambda args, result: _result_rows(result))
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        frame = [key, 0.]   # time spent in the instrumented functions called by this one
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+        try:
+            n = rows(args, result)
+        except Exception:
+            n = 0
+        _record(key, name, elapsed, elapsed - frame[1], stack[-1][0] if stack else None, n)
+        return(result)
+    wrapper.__instrumented__ = True
+    return(wrapper)
+
+
+def enable(modules = None):
+    if modules is None:
+        import emitted_electrons, avg_photon
+        modules = [emitted_electrons, avg_photon]
+    modules = [modules] if not isinstance(modules, (list, tuple)) else modules
+    with _lock:
+        wrappers = {}   # original function -> wrapper
+        for module in modules:
+            for attr, value in list(vars(module).items()):
+                if (attr.startswith("_") or not callable(value) or getattr(value, "__instrumented__", False)
+                        or not hasattr(value, "__code__") or value.__module__ != module.__name__):
+                    continue
+                wrappers[value] = _wrap(value, module.__name__ + "." + attr)
+        # the functions imported by name into other modules (from emitted_electrons import ...) are replaced too
+        for module in list(sys.modules.values()):
+            names = getattr(module, "__dict__", None)
+            if names is None:
+                continue
+            for attr, value in list(names.items()):
+                try:
+                    wrapper = wrappers.get(value)
+                except TypeError:   # unhashable object
+                    continue
+                if wrapper is not None:
+                    _originals.setdefault((module.__name__, attr), value)
+                    setattr(module, attr, wrapper)
+
+
+def disable():
+    with _lock:
+        for (name, attr), value in _originals.items():
+            if name in sys.modules:
+                setattr(sys.modules[name], attr, value)
+        _originals.clear()
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+@contextlib.contextmanager
+def profiling(modules = None):
+    reset()
+    enable(modules)
+    try:
+        yield
+    finally:
+        disable()
+
+
+def report():
+    result = {}
+    with _lock:
+        for s in _stats.values():
+            p = np.percentile(s["samples"], percentiles) if s["samples"] else [np.nan]*len(percentiles)
+            result[s["name"]] = {"calls": s["calls"], "total": s["total"], "own": s["own"], "mean": s["total"]/s["calls"],
+                                 "rows": s["rows"], "max": s["max"]}
+            result[s["name"]].update({"p%d" % q: float(v) for q, v in zip(percentiles, p)})
+    return(result)
+
+
+def export_json(path):
+    with open(path, "w") as f:
+        json.dump(report(), f, indent = 1)
+
+
+def export_pstats(path):
+    # pstats format: {(file, line, name): (primitive calls, calls, own time, total time, {caller: (calls, calls, own, total)})}
+    with _lock:
+        stats = {key: (s["calls"], s["calls"], s["own"], s["total"], {c: (v[0], v[0], v[1], v[2]) for c, v in s["callers"].items()})
+                 for key, s in _stats.items()}
+    with open(path, "wb") as f:
+        marshal.dump(stats, f)
+
+
+def _export_at_exit():
+    path = os.environ.get(output_var, "inner_shell_profile.json")
+    if path.endswith(".json"):
+        export_json(path)
+    else:
+        export_pstats(path)
+
+
+def enable_from_environment(name):  # called at the end of the import of emitted_electrons and avg_photon
+    global _exit_report
+    if os.environ.get(env_var, "") not in ("", "0"):
+        if not _exit_report:
+            atexit.register(_export_at_exit)
+            _exit_report = True
+        enable([sys.modules[name]])
+
+
+
+"""
+Applications of the functions
+"""
+
+# Where does the time go in avg_photon_table?
+#import emitted_electrons as ee
+#with profiling():
+#    ee.avg_photon_table(None)
+#print(report())
+#export_pstats("avg_photon_table.prof")
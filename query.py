@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command-line tool answering a stream of (Z, st, s[, il]) queries with the results of electrons and avg_photon
+
+The queries are read from a file or from the standard input, one per line, as CSV ("26,1,1" or "26,1,1,3", a header on the
+first line is skipped) or as JSON lines ({"Z": 26, "st": 1, "s": 1, "il": 3}); the lines that are not queries (wrong
+number of fields, missing keys, values that are not integers) are reported on the standard error and skipped.
+They are processed by chunks of lines with array lookups, and the results of each chunk are written before the
+next one is read, so the memory used does not depend on the length of the stream.
+
+For each query the output gives the probabilities to emit 1-10 electrons (p1-p10, electrons), the mean number of
+Auger electrons and their energy (N_e, E_e), the mean number of photons and their energy (N_p, E_p, avg_photon) and,
+if il is given, the mean number of photons of this type of transition per vacancy (N_il). The values are NaN (null
+in JSON) for the combinations missing from table2.
+
+Usage:
+python query.py queries.csv > results.csv
+cat queries.jsonl | python query.py --format jsonl --chunk 100000
+
+Recap of all functions:
+
+query_tables(): per row of table2, the results (p1-p10, N_e, E_e, N_p, E_p) and the photons per vacancy of each il
+answer(Z, st, s, il): results of arrays of queries, shape (N, 15) (NaN for the missing combinations)
+parse_chunk(lines, fmt, first): Z, st, s and il (-1 if not given) of a list of lines
+read_chunks(stream, fmt, chunk): parsed queries of a stream, chunk by chunk
+write_chunk(stream, Z, st, s, il, results, fmt): writes the results of a chunk
+main(argv): the command-line tool
+"""
+
+import sys
+import json
+import argparse
+import itertools
+import numpy as np
+import emitted_electrons as ee
+
+columns = ["p%d" % n for n in range(1, 11)] + ["N_e", "E_e", "N_p", "E_p", "N_il"]
+_query_tables = None
+
+
+@ee.on_reload
+def _clear():   # the tables were reloaded (set_precision, shared_tables.attach)
+    global _query_tables
+    _query_tables = None
+
+
+def query_tables():
+    global _query_tables
+    if _query_tables is not None:
+        return(_query_tables)
+    energy_tab = ee.avg_photon_table(None)
+    results = np.empty((len(ee.auger_tab), 14))
+    results[:, :10] = ee.auger_tab["counts"]/10000
+    results[:, 10:] = energy_tab[:, 3:7]
+    
+    # mean number of photons of each type of transition per vacancy: sum over delta of proba[delta]*w
+    keys = ee.key_columns(ee.fluo_lines, 5)
+    rows = ee.row_idx[keys[:, 0], keys[:, 1], keys[:, 2]]
+    valid = rows >= 0
+    weights = results[rows[valid], keys[valid, 3]]*ee.fluo_lines["w"][valid]
+    il_photons = np.bincount(rows[valid]*ee.N_IL + keys[valid, 4], weights = weights, minlength = len(ee.auger_tab)*ee.N_IL)
+    _query_tables = (results, il_photons.reshape(len(ee.auger_tab), ee.N_IL))
+    return(_query_tables)
+
+
+def answer(Z, st, s, il = -1):
+    results, il_photons = query_tables()
+    rows = ee.Z_st_s_rows(Z, st, s)
+    il = np.broadcast_to(np.asarray(il, dtype = int), rows.shape)
+    valid = rows >= 0
+    out = np.full(rows.shape + (15,), np.nan)
+    out[valid, :14] = results[rows[valid]]
+    with_il = valid & (il >= 0) & (il < ee.N_IL)
+    out[with_il, 14] = il_photons[rows[with_il], il[with_il]]
+    return(out)
+
+
+def _number(field):
+    try:
+        return(float(field))
+    except ValueError:
+        return(np.nan)
+
+
+def _json_query(line):  # Z, st, s and il of a JSON line as floats (NaN if it is not a query)
+    try:
+        q = json.loads(line)
+        values = [q["Z"], q["st"], q["s"], q.get("il", -1)]
+    except (ValueError, KeyError, TypeError, AttributeError):   # not JSON, not an object or a missing key
+        return([np.nan]*4)
+    return([float(x) if type(x) in (int, float) else np.nan for x in values])
+
+
+def parse_chunk(lines, fmt = "csv", first = 1):
+    # first: number of the first line in the stream; the line 1 of a CSV stream is skipped if it is not a query (a
+    # header), the other lines that are not queries (wrong number of fields, values that are not integers) are
+    # reported on the standard error and skipped, in both formats
+    queries = []
+    numbers = []
+    for i, line in enumerate(lines):
+        if fmt == "jsonl":
+            line = line.strip()
+            if line:
+                queries.append(_json_query(line))
+                numbers.append(first + i)
+        else:
+            fields = line.replace(",", " ").split()
+            if fields:  # skips the empty lines
+                queries.append((fields + ["-1"])[:4] if len(fields) in (3, 4) else ["nan"]*4)
+                numbers.append(first + i)
+    
+    try:
+        values = np.array(queries, dtype = float).reshape(-1, 4)    # "26", "26.0" and "2.6e1" are all 26
+    except ValueError:  # some fields are not numbers
+        values = np.array([[_number(x) for x in q] for q in queries]).reshape(-1, 4)
+    with np.errstate(invalid = "ignore"):   # NaN for the fields that are not numbers
+        good = np.all((values == np.round(values)) & (np.abs(values) < 2**31), axis=1)
+    for row in np.flatnonzero(~good).tolist():
+        if numbers[row] != 1 or fmt == "jsonl":
+            sys.stderr.write("line %d skipped (not a Z, st, s[, il] query): %s\n" % (numbers[row], lines[numbers[row] - first].strip()))
+    queries = values[good].astype(int)
+    return(queries[:, 0], queries[:, 1], queries[:, 2], queries[:, 3])
+
+
+def read_chunks(stream, fmt = "csv", chunk = 65536):
+    first = 1
+    while True:
+        lines = list(itertools.islice(stream, chunk))
+        if not lines:
+            return
+        yield(parse_chunk(lines, fmt, first))
+        first += len(lines)
+
+
+def write_chunk(stream, Z, st, s, il, results, fmt = "csv"):
+    if fmt == "jsonl":
+        for q, r in zip(zip(Z.tolist(), st.tolist(), s.tolist(), il.tolist()), results.tolist()):
+            r = [None if x != x else x for x in r] # NaN is not valid JSON
+            line = {"Z": q[0], "st": q[1], "s": q[2], "il": q[3], "proba": r[:10]}
+            line.update(zip(columns[10:], r[10:]))
+            stream.write(json.dumps(line) + "\n")
+    else:
+        line = ",".join(["%d"]*4 + ["%.10g"]*15) + "\n"
+        stream.write("".join([line % tuple(r) for r in np.column_stack((Z, st, s, il, results)).tolist()]))
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Emitted electrons and photons for (Z, st, s[, il]) queries")
+    parser.add_argument("input", nargs = "?", default = "-", help = "CSV or JSON lines file of queries (- for the standard input)")
+    parser.add_argument("-o", "--output", default = "-", help = "output file (- for the standard output)")
+    parser.add_argument("--format", choices = ["csv", "jsonl"], help = "input and output format (from the file extension by default)")
+    parser.add_argument("--chunk", type = int, default = 65536, help = "number of lines processed at once")
+    args = parser.parse_args(argv)
+    
+    fmt = args.format or ("jsonl" if args.input.endswith((".jsonl", ".json")) else "csv")
+    source = sys.stdin if args.input == "-" else open(args.input)
+    target = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        if fmt == "csv":
+            target.write(",".join(["Z", "st", "s", "il"] + columns) + "\n")
+        for Z, st, s, il in read_chunks(source, fmt, args.chunk):
+            write_chunk(target, Z, st, s, il, answer(Z, st, s, il), fmt)
+            target.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+
+if __name__ == "__main__":
+    main()
+
+
+
+"""
+Applications of the functions
+"""
+
+# Results of Fe I with a K-shell vacancy, and its K alpha_1 photons (il = 2):
+#answer(26, 1, 1, 2)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch rendering of the graphs of graphs.py for the whole grid, on a pool of processes
+
+Every figure is an explicit matplotlib Figure drawn on an Agg canvas (no pyplot, no display), saved and then
+cleared, so the memory of the workers does not grow with the number of figures. The workers share the tables of
+the parent process (shared_tables.py) instead of loading them again.
+
+A figure is only rendered again when its inputs have changed: the digest of the values it plots, of its
+arguments, of the rendering options and of the code of graphs.py is kept in the manifest of the output
+directory (render_manifest.json), and the figures with the same digest as in the manifest (and whose file
+exists) are skipped.
+
+Usage:
+python render.py figures                               # every kind of figure
+python render.py figures --kinds electrons,fluo_yield  # some kinds only
+python render.py figures --processes 8 --format pdf --force
+
+Recap of all functions:
+
+sweep(kinds): figures of each kind: (file name, [(plot function of graphs.py, arguments), ...])
+render(out_dir, kinds, processes, fmt, dpi, force, chunksize): renders the figures that changed, returns the rendered and skipped file names
+main(argv): the command-line tool
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import multiprocessing
+import numpy as np
+import emitted_electrons as ee
+import avg_photon as ap
+import shared_tables
+import graphs
+
+kinds = ("electrons", "all_electrons", "energy_Z", "fluo_yield", "all_fluo_yield")
+manifest_name = "render_manifest.json"
+figsize = (6.4, 4.8)
+_label_files = ("elements_names", "ionisation_stages", "initial_gap", "il")
+
+_data = {   # function of emitted_electrons/ avg_photon plotted by each function of graphs.py
+    "plot_electrons": ee.electrons,
+    "plot_all_electrons": ee.all_electrons,
+    "plot_fluo_yield": ee.fluo_yield,
+    "plot_energy": ee.energy,
+    "plot_energy_st": ee.energy_st,
+    "plot_all_fluo_yield": ee.all_fluo_yield,
+    "plot_avg_energy_st": ap.emission_st,
+    "plot_avg_energy_Z": ap.emission_Z,
+    "plot_avg_number_Z": ap.emission_Z,
+}
+
+
+def sweep(kinds = kinds):
+    figures = []
+    groups = [(name.replace(" ", "_"), il) for name, il in ee.line_groups.items()]
+    if "electrons" in kinds:
+        figures += [("electrons_Z%d_st%d_s%d" % key, [("plot_electrons", key)]) for key in shared_tables.grid()]
+    if "all_electrons" in kinds:
+        figures += [("all_electrons_s%d" % s, [("plot_all_electrons", (s,))]) for s in range(1, 8)]
+    if "energy_Z" in kinds:     # the loop of the examples of graphs.py
+        for s in range(1, 8):
+            figures.append(("mean_energy_s%d" % s, [("plot_avg_energy_Z", (s,))]))
+            figures.append(("mean_number_s%d" % s, [("plot_avg_number_Z", (s,))]))
+    if "fluo_yield" in kinds:
+        figures += [("fluo_yield_Z%d_%s" % (Z, name), [("plot_fluo_yield", (Z, il))]) for Z in range(5, 31) for name, il in groups]
+    if "all_fluo_yield" in kinds:
+        figures += [("all_fluo_yield_%s" % name, [("plot_all_fluo_yield", (1, il))]) for name, il in groups]
+    return(figures)
+
+
+def _hash_values(h, x):   # any result (nested tuples/ lists of arrays, numbers and strings)
+    if isinstance(x, (tuple, list)):
+        h.update(b"(%d" % len(x))
+        for y in x:
+            _hash_values(h, y)
+        h.update(b")")
+    else:
+        a = np.ascontiguousarray(x)
+        h.update(("%s%s" % (a.dtype.str, a.shape)).encode())
+        h.update(a.tobytes())
+
+
+def _digest(plots, options):
+    h = hashlib.sha1(repr((plots, options)).encode())
+    h.update(_code_digest)
+    for name, args in plots:
+        _hash_values(h, _data[name](*args))
+    return(h.hexdigest())
+
+
+def _source_digest():  # code of the graphs, names used in the titles and legends, and version of matplotlib
+    import matplotlib
+    h = hashlib.sha1(matplotlib.__version__.encode())
+    for path in [graphs.__file__] + [os.path.join(ee.data_dir, name) for name in _label_files]:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return(h.digest())
+
+
+_code_digest = _source_digest()
+
+
+def _init_worker(handle):
+    import matplotlib
+    matplotlib.use("Agg")   # also for code calling pyplot in the workers
+    if handle is not None:
+        shared_tables.attach(handle)
+
+
+def _render(task):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    path, plots, options, previous = task
+    digest = _digest(plots, options)
+    if digest == previous and os.path.exists(path):
+        return(path, digest, False)
+    fig = Figure(figsize = figsize, dpi = options["dpi"])
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    for name, args in plots:
+        getattr(graphs, name)(ax, *args)
+    tmp = path + ".tmp"
+    fig.savefig(tmp, format = options["format"])
+    os.replace(tmp, path)   # no partial file if the rendering is interrupted
+    fig.clear()
+    return(path, digest, True)
+
+
+def _write_manifest(path, manifest):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent = 0, sort_keys = True)
+    os.replace(tmp, path)
+
+
+def render(out_dir, kinds = kinds, processes = None, fmt = "png", dpi = 100, force = False, chunksize = 8):
+    # processes = 1: rendered in this process (no pool)
+    os.makedirs(out_dir, exist_ok = True)
+    manifest_path = os.path.join(out_dir, manifest_name)
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    options = {"format": fmt, "dpi": dpi, "figsize": figsize}
+    tasks = []
+    for name, plots in sweep(kinds):
+        filename = name + "." + fmt
+        tasks.append((os.path.join(out_dir, filename), plots, options, manifest.get(filename)))
+    
+    rendered, skipped = [], []
+    try:
+        if processes == 1:
+            for path, digest, done in map(_render, tasks):
+                manifest[os.path.basename(path)] = digest
+                (rendered if done else skipped).append(path)
+        else:
+            with shared_tables.publish() as tables:
+                ctx = multiprocessing.get_context()
+                with ctx.Pool(processes, initializer = _init_worker, initargs = (tables.handle,)) as pool:
+                    for path, digest, done in pool.imap_unordered(_render, tasks, chunksize = chunksize):
+                        manifest[os.path.basename(path)] = digest
+                        (rendered if done else skipped).append(path)
+    finally:    # the figures already rendered are kept in the manifest if the sweep is interrupted
+        _write_manifest(manifest_path, manifest)
+    return(rendered, skipped)
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Renders the graphs of the emitted electrons and photons for the whole grid")
+    parser.add_argument("out_dir", help = "directory of the figures")
+    parser.add_argument("--kinds", default = ",".join(kinds), help = "kinds of figures, separated by commas (%s)" % ", ".join(kinds))
+    parser.add_argument("--processes", type = int, help = "worker processes (all the cores by default, 1: no pool)")
+    parser.add_argument("--format", default = "png", help = "file format (png, pdf, svg, ...)")
+    parser.add_argument("--dpi", type = int, default = 100)
+    parser.add_argument("--force", action = "store_true", help = "render every figure, even if its inputs did not change")
+    args = parser.parse_args(argv)
+    unknown = set(args.kinds.split(",")) - set(kinds)
+    if unknown:
+        parser.error("unknown kinds: " + ", ".join(sorted(unknown)))
+    rendered, skipped = render(args.out_dir, args.kinds.split(","), args.processes, args.format, args.dpi, args.force)
+    print("%d figures rendered, %d unchanged" % (len(rendered), len(skipped)))
+    return(0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+
+
+"""
+Applications of the functions
+"""
+
+# K alpha and K beta yields of all the elements and the mean energies of all the shells, on 8 processes:
+#rendered, skipped = render("figures", ["fluo_yield", "energy_Z"], processes = 8)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local query server: the tables are loaded and indexed once, and shared by all the processes of a node
+
+The server (asyncio) listens on a Unix socket (or on a localhost TCP port) and answers JSON lines requests
+{"id": 1, "fn": "query", "args": [Z, st, s, il]} with {"id": 1, "result": ...}. The functions are query (the
+results of query.answer for arrays of Z, st, s and il), electrons, fluo_yield, energy and avg_photon. The query
+requests received while a batch is being computed are coalesced: they are answered together by one call of
+query.answer on the concatenated arrays.
+
+The Client sends the requests to the server and falls back to computing them in its own process (same results)
+when no server is running. A request that fails is answered with {"id": 1, "error": message, "type": name of the
+exception}, and the Client raises the same type of exception as compute (ValueError, TypeError, IndexError, KeyError
+or OverflowError, RuntimeError for the other ones) in both cases.
+
+Usage:
+python server.py                   # Unix socket (default_path)
+python server.py --port 8765       # localhost TCP port
+
+Recap of all functions:
+
+compute(fn, args): result of a request computed in this process (lists, for JSON)
+serve(path, port): runs the server until it is stopped
+Client(path, port): client with the methods query, electrons, fluo_yield, energy and avg_photon
+"""
+
+import os
+import json
+import builtins
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import numpy as np
+import emitted_electrons as ee
+import query
+
+default_path = os.path.join(tempfile.gettempdir(), "inner_shell_ionization.sock")
+_errors = ("ValueError", "TypeError", "IndexError", "KeyError", "OverflowError")  # raised again by the Client
+
+
+def _error(id, error):  # response to a request that failed
+    return({"id": id, "error": str(error), "type": type(error).__name__})
+
+
+def _tolist(x):
+    if isinstance(x, (tuple, list)):
+        return([_tolist(y) for y in x])
+    if isinstance(x, np.ndarray):
+        return(x.tolist())
+    if isinstance(x, np.generic):
+        return(x.item())
+    return(x)
+
+
+def compute(fn, args):
+    if fn == "query":
+        return(query.answer(*args).tolist())
+    if fn == "electrons":
+        return(_tolist(ee.electrons(*args)))
+    if fn == "fluo_yield":
+        return(_tolist(ee.fluo_yield(*args)))
+    if fn == "energy":
+        return(_tolist(ee.energy(*args)))
+    if fn == "avg_photon":
+        return(_tolist(ee.avg_photon(*args)))
+    raise ValueError("unknown function %r" % fn)
+
+
+class _Batcher:   # coalesces the query requests waiting while the previous batch is computed
+    def __init__(self):
+        self.pending = asyncio.Queue()
+    
+    async def submit(self, args):
+        future = asyncio.get_running_loop().create_future()
+        await self.pending.put((args, future))
+        return(await future)
+    
+    async def run(self):
+        while True:
+            batch = [await self.pending.get()]
+            while not self.pending.empty():
+                batch.append(self.pending.get_nowait())
+            ready = []  # (future, broadcast arguments) of the valid requests: an invalid one only fails its own request
+            for args, future in batch:
+                try:
+                    ready.append((future, np.broadcast_arrays(*[np.asarray(a, dtype = int) for a in (list(args) + [-1])[:4]])))
+                except Exception as error:
+                    future.set_exception(error)
+            if not ready:
+                continue
+            try:
+                results = query.answer(*[np.concatenate([a[i].ravel() for future, a in ready]) for i in range(4)])
+            except Exception:
+                results = None  # each request is computed on its own to find the one that failed
+            start = 0
+            for future, a in ready:
+                size = a[0].size
+                try:
+                    result = results[start:start + size] if results is not None else query.answer(*[x.ravel() for x in a])
+                    future.set_result(result.reshape(a[0].shape + (15,)).tolist())
+                except Exception as error:
+                    future.set_exception(error)
+                start += size
+
+
+async def _handle(reader, writer, batcher, connections):
+    async def answer(request):
+        try:
+            if request["fn"] == "query":
+                result = await batcher.submit(request["args"])
+            else:
+                result = compute(request["fn"], request["args"])
+            response = {"id": request.get("id"), "result": result}
+        except Exception as error:
+            response = _error(request.get("id"), error)
+        writer.write((json.dumps(response) + "\n").encode())
+    
+    connections.add(asyncio.current_task())
+    tasks = []
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("a request must be a JSON object")
+            except ValueError as error:    # malformed line: answered without an id
+                writer.write((json.dumps(_error(None, error)) + "\n").encode())
+                await writer.drain()
+                continue
+            tasks.append(asyncio.ensure_future(answer(request)))    # requests of a client can be pipelined
+            tasks = [t for t in tasks if not t.done()]
+            await writer.drain()
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:  # the server is stopping: the connection is closed without an error
+        for task in tasks:
+            task.cancel()
+    finally:
+        connections.discard(asyncio.current_task())
+        writer.close()
+
+
+async def _serve(path = default_path, port = None):
+    ee.load_tables()
+    query.query_tables()    # everything is loaded and indexed before the first request
+    batcher = _Batcher()
+    batching = asyncio.ensure_future(batcher.run())
+    connections = set() # tasks of the connected clients
+    handler = lambda reader, writer: _handle(reader, writer, batcher, connections)
+    if port is not None:
+        server = await asyncio.start_server(handler, "127.0.0.1", port)
+    else:
+        if os.path.exists(path):
+            os.remove(path)
+        server = await asyncio.start_unix_server(handler, path)
+    stop = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)   # kill also removes the socket
+    except NotImplementedError:
+        pass
+    async with server:
+        await stop.wait()
+        server.close()  # no new connections, and the open ones are closed
+        for task in list(connections):
+            task.cancel()
+        await asyncio.gather(*connections, return_exceptions = True)
+    batching.cancel()
+
+
+def serve(path = default_path, port = None):
+    try:
+        asyncio.run(_serve(path, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if port is None and os.path.exists(path):
+            os.remove(path)
+
+
+class Client:
+    # the requests go to the server if it is running, otherwise they are computed in this process
+    def __init__(self, path = default_path, port = None):
+        self.path = path
+        self.port = port
+        self.sock = None
+        self.file = None
+        self.next_id = 0
+    
+    def connect(self):   # True if the server answered
+        if self.file is not None:
+            return(True)
+        try:
+            if self.port is not None:
+                self.sock = socket.create_connection(("127.0.0.1", self.port))
+            else:
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.connect(self.path)
+        except (OSError, AttributeError):   # no server (or no Unix sockets on this system)
+            self.close()
+            return(False)
+        self.file = self.sock.makefile("rwb")
+        return(True)
+    
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.file = None
+    
+    def request(self, fn, *args):
+        args = _tolist(args)
+        if not self.connect():
+            return(compute(fn, args))
+        self.next_id += 1
+        try:
+            self.file.write((json.dumps({"id": self.next_id, "fn": fn, "args": args}) + "\n").encode())
+            self.file.flush()
+            response = json.loads(self.file.readline())
+        except (OSError, ValueError):  # the server stopped
+            self.close()
+            return(compute(fn, args))
+        if "error" in response:  # same exception as compute
+            error = response.get("type")
+            raise (getattr(builtins, error) if error in _errors else RuntimeError)(response["error"])
+        return(response["result"])
+    
+    def query(self, Z, st, s, il = -1):  # same as query.answer
+        return(np.array(self.request("query", Z, st, s, il), dtype = float))
+    
+    def electrons(self, Z, st, s):
+        return(np.array(self.request("electrons", Z, st, s)))
+    
+    def fluo_yield(self, Z, il):
+        return(np.array(self.request("fluo_yield", Z, il), dtype = float))
+    
+    def energy(self, Z, s):
+        return(tuple(np.array(x, dtype = float) for x in self.request("energy", Z, s)))
+    
+    def avg_photon(self, Z, st, s):
+        result = self.request("avg_photon", Z, st, s)
+        return(tuple(result) if result else [])
+    
+    def __enter__(self):
+        return(self)
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Local server for the emitted electrons and photons")
+    parser.add_argument("--path", default = default_path, help = "Unix socket")
+    parser.add_argument("--port", type = int, help = "localhost TCP port instead of the Unix socket")
+    args = parser.parse_args(argv)
+    serve(args.path, args.port)
+
+
+if __name__ == "__main__":
+    main()
+
+
+
+"""
+Applications of the functions
+"""
+
+# With or without "python server.py" running:
+#with Client() as client:
+#    proba = client.electrons(26, 1, 1)
+#    results = client.query(np.full(1000, 26), np.arange(1000) % 26 + 1, 1)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tables of emitted_electrons and avg_photon shared by the processes of a multiprocessing pool
+
+publish() reads and indexes the tables once and copies all of their arrays (tables and indexes) into one block of
+multiprocessing.shared_memory. The workers of the pool attach to it (attach, given as the pool initializer): the
+arrays of emitted_electrons and avg_photon become views of the shared block, so nothing is parsed, built or copied
+in the workers and their memory does not grow with the number of processes.
+
+Recap of all functions:
+
+publish(): SharedTables object owning the shared block (handle: what the workers need to attach, close(): frees it)
+attach(handle): makes emitted_electrons and avg_photon use the arrays of the shared block (in a worker)
+grid(): (Z, st, s) of every row of table2
+parallel_map(func, keys, processes, chunksize): func(Z, st, s) for all (Z, st, s) of keys (the whole grid by default) on a pool of processes
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import emitted_electrons as ee
+import avg_photon as ap
+
+_avg_names = ("tab", "tab_idx")
+_align = 64 # bytes
+_shm = None # shared block attached by this worker (kept open as long as the process lives)
+
+
+class SharedTables:
+    def __init__(self):
+        ee.load_tables()
+        ap.load_tab()
+        arrays = [("ee", name, np.asarray(getattr(ee, name))) for name in ee._table_names]
+        arrays += [("ap", name, np.asarray(getattr(ap, name))) for name in _avg_names]
+        
+        layout = []  # (module, name, offset, dtype, shape) of each array in the block
+        size = 0
+        for module, name, a in arrays:
+            layout.append((module, name, size, a.dtype, a.shape))
+            size += -(-a.nbytes//_align)*_align
+        self.shm = shared_memory.SharedMemory(create = True, size = max(size, 1))
+        for (module, name, a), (m, n, offset, dtype, shape) in zip(arrays, layout):
+            np.ndarray(shape, dtype, buffer = self.shm.buf, offset = offset)[...] = a
+        self.handle = (self.shm.name, layout)
+    
+    def close(self):    # the workers must have stopped
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+    
+    def __enter__(self):
+        return(self)
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def publish():
+    return(SharedTables())
+
+
+def attach(handle):
+    global _shm
+    name, layout = handle
+    _shm = shared_memory.SharedMemory(name = name)  # the block is unlinked by the process that published it
+    modules = {"ee": ee, "ap": ap}
+    with ee._load_lock, ap._load_lock:
+        for module, n, offset, dtype, shape in layout:
+            a = np.ndarray(shape, dtype, buffer = _shm.buf, offset = offset)
+            a.flags.writeable = False
+            setattr(modules[module], n, a)
+        ee._loaded = True
+        ap._loaded = True
+    ee.clear_caches()   # results computed with the tables of this process before it attached
+
+
+def grid():
+    ee.load_tables()
+    return([tuple(key) for key in ee.key_columns(ee.auger_tab).tolist()])
+
+
+def _call(args):
+    func, key = args
+    return(func(*key))
+
+
+def parallel_map(func, keys = None, processes = None, chunksize = 16, context = None):
+    # func must be picklable (a function defined at the top level of a module, such as emitted_electrons.avg_photon);
+    # context: multiprocessing start method ("fork", "spawn", "forkserver"), the default one if None
+    keys = grid() if keys is None else [tuple(key) for key in keys]
+    with publish() as tables:
+        ctx = multiprocessing.get_context(context)
+        with ctx.Pool(processes, initializer = attach, initargs = (tables.handle,)) as pool:
+            return(pool.map(_call, [(func, key) for key in keys], chunksize = chunksize))
+
+
+
+"""
+Applications of the functions
+"""
+
+# avg_photon for every row of table2 on all the cores:
+#results = parallel_map(ee.avg_photon)
+
+# Own pool, with the tables shared by its workers:
+#with publish() as tables:
+#    with multiprocessing.get_context("spawn").Pool(64, initializer = attach, initargs = (tables.handle,)) as pool:
+#        results = pool.starmap(ee.energy, [(Z, 1) for Z in range(5, 31)])
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fluorescence lines of table3 sorted by photon energy, for energy window queries
+
+The lines are the rows of emitted_electrons.fluo_lines (table3 sorted by Z, st, s, delta and il). They are sorted
+by photon energy, after the element and/ or the ionisation stage when the query is restricted to them, so that the
+lines of any window are a contiguous slice found with np.searchsorted.
+
+Recap of all functions:
+
+line_index(by): lines sorted by energy (by = None), by element and energy ("Z"), by stage and energy ("st") or by ion and energy ("Z_st")
+window_slices(E_min, E_max, Z, st): first and last+1 positions in the index of the lines with E_min <= E <= E_max, and their total yield, for arrays of windows
+lines_in_window(E_min, E_max, Z, st): rows, energies, yields and names (element, stage, shell, transition) of the lines of one window
+"""
+
+import numpy as np
+import emitted_electrons as ee
+
+scale = 1e5 # the photon energies are below 1e4 eV: the sort key is group*scale + energy
+_indexes = {}
+
+
+@ee.on_reload
+def _clear():   # the tables were reloaded (set_precision, shared_tables.attach)
+    _indexes.clear()
+
+
+def _group_key(Z, st, by):
+    if by is None:
+        return(0)
+    if by == "Z":
+        return(Z)
+    if by == "st":
+        return(st)
+    return(Z*ee.N_ST + st)
+
+
+def line_index(by = None):  # sorted keys, rows of fluo_lines in that order and cumulative sum of their yields
+    if by in _indexes:
+        return(_indexes[by])
+    ee.load_tables()
+    lines = ee.fluo_lines
+    keys = _group_key(lines["Z"].astype(int), lines["st"].astype(int), by)*scale + ee.fluo_E   # energies of table3, not of the compact table
+    order = np.argsort(keys, kind = "stable")
+    cum_w = np.append(0, np.cumsum(lines["w"][order], dtype = float))
+    _indexes[by] = (keys[order], order, cum_w)
+    return(_indexes[by])
+
+
+def window_slices(E_min, E_max, Z = None, st = None):
+    # E_min, E_max (and Z, st if given) are broadcast together, one window for each element; the lines of the
+    # window i are line_index(by)[1][start[i]:stop[i]]
+    by = None if Z is None and st is None else "Z" if st is None else "st" if Z is None else "Z_st"
+    keys, order, cum_w = line_index(by)
+    group = _group_key(np.asarray(Z), np.asarray(st), by)*scale
+    # the bounds are clipped to [0, scale) so that a window never reaches the lines of the neighbouring groups
+    E_min = np.clip(np.asarray(E_min, dtype = float), 0, scale)
+    E_max = np.clip(np.asarray(E_max, dtype = float), -1, np.nextafter(scale, 0))
+    start = np.searchsorted(keys, group + E_min, side = "left")
+    stop = np.maximum(np.searchsorted(keys, group + E_max, side = "right"), start)    # empty window if E_max < E_min
+    return(start, stop, cum_w[stop] - cum_w[start])
+
+
+def lines_in_window(E_min, E_max, Z = None, st = None):
+    by = None if Z is None and st is None else "Z" if st is None else "st" if Z is None else "Z_st"
+    start, stop, w_total = window_slices(E_min, E_max, Z, st)
+    rows = line_index(by)[1][start:stop]
+    lines = ee.fluo_lines[rows]
+    names = [ee.correspondence(int(l["Z"]), int(l["st"]), int(l["s"]), int(l["il"])) for l in lines]
+    return(rows, ee.fluo_E[rows], lines["w"].astype(float), names)
+
+
+
+"""
+Applications of the functions
+"""
+
+# Lines between 6.3 and 6.5 keV (Fe K alpha):
+#rows, energies, yields, names = lines_in_window(6300, 6500)
+
+# Total yield of the iron lines in 1000 detector channels of 10 eV:
+#edges = np.arange(0, 10010, 10)
+#start, stop, w_total = window_slices(edges[:-1], edges[1:] - 1e-6, Z = 26)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fluorescence emission spectra of many plasma cells at once (table2 and table3)
+
+For each row (Z, st, s) of table2, one vacancy emits on average proba[delta]*w photons in each transition of table3
+(the weights of avg_photon). These photons are binned on the energy grid once (response matrix, rows of table2 x
+energy bins), and the spectrum of the cells is the sparse matrix (cells x rows of table2) of the number of
+vacancies per second (ion fraction x vacancy rate of the shell) times the response.
+
+Recap of all functions:
+
+response_matrix(edges, energy): sparse (rows of table2 x bins) number (or energy if energy = True) of photons per vacancy in each bin
+vacancy_matrix(ions, rates): sparse (cells x rows of table2) number of vacancies per second
+spectrum(ions, rates, edges, energy): photon (or energy) emissivity of each cell in each bin
+"""
+
+import numpy as np
+from scipy import sparse
+import emitted_electrons as ee
+
+
+def response_matrix(edges, energy = False):
+    ee.load_tables()
+    edges = np.asarray(edges, dtype = float)
+    lines = ee.fluo_lines
+    keys = ee.key_columns(lines, 5)
+    rows = ee.row_idx[keys[:, 0], keys[:, 1], keys[:, 2]]
+    bins = np.searchsorted(edges, ee.fluo_E, side = "right") - 1    # energies of table3 (a line on an edge is in the bin above)
+    keep = (rows >= 0) & (bins >= 0) & (bins < len(edges) - 1)    # lines with a row in table2 and inside the grid
+    
+    value = ee.auger_tab["counts"][rows[keep], keys[keep, 3]]/10000*lines["w"][keep]  # proba[delta]*w
+    if energy:
+        value = value*ee.fluo_E[keep]
+    return(sparse.csr_matrix((value, (rows[keep], bins[keep])), shape = (len(ee.auger_tab), len(edges) - 1)))
+
+
+def vacancy_matrix(ions, rates):
+    # ions[c, Z, st]: ion fractions (or densities) of each cell, shape (cells, 31, 31) or (31, 31) for one cell
+    # rates[s-1] or rates[c, s-1]: vacancies per second and per ion in the shell s
+    ee.load_tables()
+    ions = np.asarray(ions, dtype = float)
+    if ions.ndim == 2:
+        ions = ions[None]
+    rates = np.broadcast_to(np.asarray(rates, dtype = float), (len(ions), 7))
+    Z, st, s = ee.key_columns(ee.auger_tab).T
+    
+    cell, row = np.nonzero(ions[:, Z, st])  # only the ions present in each cell
+    value = ions[cell, Z[row], st[row]]*rates[cell, s[row] - 1]
+    return(sparse.csr_matrix((value, (cell, row)), shape = (len(ions), len(ee.auger_tab))))
+
+
+def spectrum(ions, rates, edges, energy = False):
+    return((vacancy_matrix(ions, rates) @ response_matrix(edges, energy)).toarray())
+
+
+
+"""
+Applications of the functions
+"""
+
+# Spectrum of neutral iron with one K-shell vacancy per second, with 10 eV bins:
+#ions = np.zeros((31, 31))
+#ions[26, 1] = 1
+#photons = spectrum(ions, [1, 0, 0, 0, 0, 0, 0], np.arange(0, 10010, 10))